@@ -37,6 +37,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
 
 # Set up fonts for plots
@@ -70,17 +71,8 @@ nbins = 20
 fig = plt.figure()
 
 #load the paperdata file to get the LH data
-with open(path+filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-    DD = []
-        
-    for d in data:       
-        split = d.split()        
-        dd = float(split[11])        
-        if (dd > 2.0):           
-            DD.append(dd)
+data = lhd.load_paper_data(path+filename)
+DD = data['dd_lh'][data['dd_lh_valid']]
 
 #get the median absolute devaition
 MAD = mpy.calculate_MedianAbsoluteDeviation(DD)
@@ -88,6 +88,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import rcParams
 import scipy.optimize as optimization
+import lh_data_loader as lhd
     
 # Set up fonts for plots
 rcParams['font.family'] = 'sans-serif'
@@ -126,49 +127,41 @@ location = 'Sierra Nevada'
 #optimizer has been tested and is NOT sensitive to this param. Just choose something vaguely sane
 init_Sc = 0.8
 
+#storage type of the hilltop data. np.float32 halves the memory used by very large files
+#and the fit is always done in float64
+dtype = np.float64
+
 #================ modifyable parameters end here ====================
 
 fig = plt.figure()
 
 #load the lh and relief data from the hilltopdata file
-with open(path + Filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-LH_Data = []
-R_Data = []
-
-#get the data and remove any values below 2 as these are probably artifacts
-for d in data:
-    if 'fail' not in d and len(d.split(','))>10: #len is used to skip incomplete data when processing plots on files that have ont finished running
-        split = d.split(',')
-        relief = float(split[4])
-        lh = float(split[5])            
-        slope = float(split[8])                                
-        EucDist = float(split[13])            
-        if (lh > 2.0):
-            if (relief > 2.0):                   
-                if (slope < 1.2):                        
-                    if (EucDist/lh > 0.9999 and EucDist/lh < 1.0001):                        
-                        LH_Data.append(lh)
-                        R_Data.append(relief)
-                                                
-#convert the lists into arrays
-LH_Data = np.array(LH_Data[:])
-R_Data = np.array(R_Data[:])
+#incomplete lines at the end of files which have not finished running are skipped by the loader
+#remove any values below 2 as these are probably artifacts
+data = lhd.filter_hilltop_data(path + Filename, lhd.HILLTOP_FILTER_EUCDIST, dtype=dtype)
+
+n_bytes, list_bytes = lhd.memory_footprint(data)
+print('Hilltop data uses %.1f MB, it would use %.1f MB as lists of floats' % (n_bytes/1e6, list_bytes/1e6))
+
+LH_Data = data['lh']
+R_Data = data['relief']
 
 #create the subplot and put the location name at the top
 ax = plt.gca()
 ax.text(.5,.9,location, horizontalalignment='center', transform=ax.transAxes, fontsize=16)
 
+#fit in float64 whatever type the data is stored as
+LH_Fit = np.asarray(LH_Data, dtype=np.float64)
+R_Fit = np.asarray(R_Data, dtype=np.float64)
+
 #create the parameter arrays
-EE_array = fill_array(LH_Data,EE)
-DD_array = fill_array(LH_Data,DD)
-Pr_array = fill_array(LH_Data,pr)
-Ps_array = fill_array(LH_Data,ps)
+EE_array = fill_array(LH_Fit,EE)
+DD_array = fill_array(LH_Fit,DD)
+Pr_array = fill_array(LH_Fit,pr)
+Ps_array = fill_array(LH_Fit,ps)
 
 #just want the params from the fit, dont need the covariance matrix, _    
-params, _ = optimization.curve_fit(LH_Rel, (LH_Data,DD_array,EE_array,Pr_array,Ps_array), R_Data, init_Sc)
+params, _ = optimization.curve_fit(LH_Rel, (LH_Fit,DD_array,EE_array,Pr_array,Ps_array), R_Fit, init_Sc)
     
 #get the optimized Sc
 Sc = params[0]
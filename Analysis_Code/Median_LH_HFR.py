@@ -37,6 +37,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
     
 # Set up fonts for plots
@@ -71,17 +72,8 @@ nbins = 20
 fig = plt.figure()
 
 #load the paperdata file to get the LH data
-with open(path+filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-    LH = []
-        
-    for d in data:       
-        split = d.split()        
-        lh = float(split[2])        
-        if (lh > 2.0):           
-            LH.append(lh)
+data = lhd.load_paper_data(path+filename)
+LH = data['hfr_lh'][data['hfr_lh_valid']]
 
 #get the median absolute devaition
 MAD = mpy.calculate_MedianAbsoluteDeviation(LH)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2015 Stuart W.D Grieve 2015
+
+Developer can be contacted by s.grieve _at_ ed.ac.uk
+
+This program is free software;
+you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation;
+either version 2 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY;
+without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the
+GNU General Public License along with this program;
+if not, write to:
+Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301
+USA
+
+Script to monitor a *_HilltopData.csv file while it is still being written by
+LH_Driver.cpp. 
+
+Every refresh only the lines appended since the last refresh are parsed, and the 
+median and MAD of the hillslope length and the best fit S_c value are printed.
+
+Parameters and paths to be modified are highlighted by comments. 
+
+@author: SWDG
+"""
+
+import time
+import lh_data_loader as lhd
+
+#================ modifyable parameters start here ====================
+
+path = 'C:/Users/Stuart/Desktop/FR/' #path to the folder contaning the hilltopdata files
+Filename = 'CR2_HilltopData.csv'
+
+#soil and rock density data
+pr = 2.4 *1000 #kg/m^3  (2.4 is in g/cm^3)
+ps = 1.4 *1000 
+
+#diffusivity and erosion rate data published for the site
+DD = 0.0086
+EE = 0.25
+
+#seconds to wait between refreshes
+refresh = 60
+
+#================ modifyable parameters end here ====================
+
+state = None
+
+while True:
+    state = lhd.follow_hilltop_data(path + Filename, state, sc_params=(DD, EE, pr, ps))
+
+    print('Hilltops: ' + str(state['n_rows']) + ' Median LH: ' + str(round(state['median'], 2)) + 
+          ' MAD: ' + str(round(state['mad'], 2)) + ' S_c: ' + str(state['sc']))
+
+    time.sleep(refresh)
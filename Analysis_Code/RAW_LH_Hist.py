@@ -38,6 +38,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
     
 # Set up fonts for plots
 rcParams['font.family'] = 'sans-serif'
@@ -67,23 +68,8 @@ location = 'Sierra Nevada'
 
 fig = plt.figure()
 
-#load the hilltopdata file to get the LH data 
-with open(path+filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-    LH = []
-        
-    for d in data:
-        if 'fail' not in d:
-            split = d.split(',')
-            relief = float(split[4])
-            lh = float(split[5])
-            hilltop_slope = float(split[8])
-            if (lh > 2.0):
-                if (relief > 2.0):
-                    if (hilltop_slope < 1.2):
-                        LH.append(lh)
+#stream the hilltopdata file to get the filtered LH data 
+LH = np.concatenate([chunk['lh'] for chunk in lhd.iter_hilltop_data(path+filename, lhd.HILLTOP_FILTER)])
 
 #get the median absolute devaition
 MAD = mpy.calculate_MedianAbsoluteDeviation(LH)
@@ -37,6 +37,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
     
 # Set up fonts for plots
@@ -71,19 +72,9 @@ nbins = 20
 fig = plt.figure()
 
 #load the paperdata file to get the LH data
-with open(path+filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-    SA = []
-    SA_Plot = []
-    for d in data:       
-        split = d.split()        
-        sa_lh = float(split[9])        
-        if (sa_lh > 2.0):           
-            SA.append(sa_lh)
-            if (sa_lh < plot_filter):
-                SA_Plot.append(sa_lh)
+data = lhd.load_paper_data(path+filename)
+SA = data['sa_lh'][data['sa_lh_valid']]
+SA_Plot = SA[SA < plot_filter]
 
 #get the median absolute devaition
 MAD = mpy.calculate_MedianAbsoluteDeviation(SA)
@@ -36,14 +36,8 @@ Requires the python shapefile library availibile here: URL
 def mm_to_inch(mm):
     return mm*0.0393700787
     
-def col_to_utm_x(XLL,ColIndex):
-    return XLL + ColIndex
-
-def row_to_utm_y(YLL,NRows,RowIndex):
-    return YLL+(NRows-RowIndex)
 
 import matplotlib.pyplot as plt
-import numpy as np
 import matplotlib.cm as cmx
 from matplotlib import rcParams
 import raster_plotter_simple as raster
@@ -71,19 +65,19 @@ ymax_plot = 780
 
 #================ modifyable parameters end here ====================
 
-#Load hillshaded DEM
-hillshade, hillshade_header = raster.read_flt(data_path + hillshade_file)
-
-#ignore nodata values    
-hillshade = np.ma.masked_where(hillshade == -9999, hillshade) 
+#Load only the part of the hillshaded DEM inside the plot limits, which include the max row and column
+hillshade_header = raster.read_headers(data_path + hillshade_file[:-4])
+window = raster.window_bounds(hillshade_header, rows=(ymin_plot,ymax_plot+1), cols=(xmin_plot,xmax_plot+1))
+hillshade, window_header = raster.read_flt_window(data_path + hillshade_file, window[:2], window[2:], nan=True) #nodata is read as NaN, which is not drawn
 
 #get the dimensions of the raster to plot
 x_max = hillshade_header[0]
 x_min = 0
 y_max = hillshade_header[1] 
 y_min = 0
-xll = hillshade_header[2] 
-yll = hillshade_header[3]  
+
+#converts shapefile coordinates into raster coords
+transform = raster.header_transform(hillshade_header)
  
 #create figure
 fig = plt.figure() 
@@ -92,8 +86,8 @@ fig = plt.figure()
    
 ax = plt.gca()
 
-#plot the hillshade
-plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray) 
+#plot the hillshade in the pixel coordinates of the full raster
+plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray, extent=raster.header_extent(hillshade_header, window_header)) 
 
 #place axis ticks around the bottom and left of the plot
 plt.tick_params(axis='x', which='both', top='off',length=2)
@@ -101,7 +95,7 @@ plt.tick_params(axis='y', which='both', right='off',length=2)
    
 # now get the tick marks    
 n_target_tics = 5
-xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics)  
+xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,(xmin_plot,xmax_plot,ymax_plot,ymin_plot))  
 plt.xticks(xlocs, new_x_labels)
 plt.yticks(ylocs, new_y_labels) 
 
@@ -111,26 +105,15 @@ y_center = int(y_max/2.)
 #load trace shapefile
 sf = shp.Reader(data_path + trace_file)
 
-for shape in sf.shapes():
-    x=[]
-    y=[]
-    for point in shape.points:
-        #convert shapeile data into raster coords
-        x.append(point[0]-xll)
-        y.append((-1*point[1]) + yll + hillshade_header[1])
-    ax.plot(x,y,'r-',linewidth=0.5,alpha=1)
+#each trace is drawn as its own line by a single plot call
+x, y = raster.utm_to_pixel(transform, *raster.shape_vertices(sf.shapes()))
+ax.plot(x,y,'r-',linewidth=0.5,alpha=1)
     
 #load channels
 sf = shp.Reader(data_path + 'Chans.shp')
 
-for shape in sf.shapes():
-    x=[]
-    y=[]
-    for point in shape.points:
-        #convert shapeile data into raster coords
-        x.append(point[0]-xll)
-        y.append((-1*point[1]) + yll + hillshade_header[1])
-    plt.plot(x,y,'b-',linewidth=2)           
+x, y = raster.utm_to_pixel(transform, *raster.shape_vertices(sf.shapes()))
+plt.plot(x,y,'b-',linewidth=2)           
 
 #set plot limits
 plt.xlim(xmin_plot,xmax_plot)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2015 Stuart W.D Grieve 2015
+
+Developer can be contacted by s.grieve _at_ ed.ac.uk
+
+This program is free software;
+you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation;
+either version 2 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY;
+without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the
+GNU General Public License along with this program;
+if not, write to:
+Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301
+USA
+
+Generate hillshades of *.flt DEMs, in the same 0-255 range as the *_HS.flt
+files used by the figures.
+
+Slope and aspect are found with Horn's method over each cell's 3x3
+neighbourhood. The DEM is processed in bands of rows, each read from a memory
+map with one row of overlap above and below, by a pool of worker processes
+which write straight into the output file, so DEMs larger than memory can be
+shaded on every core.
+
+Hillshades are cached next to the DEM, named by a hash of the DEM header and
+file stamp (see lh_data_loader.file_stamp) and the sun azimuth and altitude,
+eg NC_DEM.hs_1a2b3c4d5e6f_315_45.flt, so asking for the same illumination again
+returns the cached file.
+
+@author: SWDG
+"""
+
+import os
+import hashlib
+import numpy as np
+
+#number of rows of the DEM shaded by each task
+TILE_ROWS = 1024
+
+#nodata value of the hillshades written
+HILLSHADE_NODATA = -9999.
+
+
+def dem_hash(input_file):
+    """
+    Hash identifying the current version of a DEM, given its name without
+    extension, from the contents of its header and the stamp of its data (size,
+    modification time and the bytes at each end). Only a few kilobytes are
+    read, however large the DEM.
+    """
+    import lh_data_loader as lhd
+
+    digest = hashlib.sha1()
+    with open(input_file + '.hdr', 'rb') as f:
+        digest.update(f.read())
+    digest.update(lhd.file_stamp(input_file + '.flt').encode('ascii'))
+    return digest.hexdigest()
+
+
+def hillshade_file(input_file, azimuth=315., altitude=45., digest=None):
+    """
+    Name, without extension, of the cached hillshade of a DEM for a sun azimuth
+    and altitude in degrees. digest is the dem_hash of the DEM, which is found
+    if it is not given.
+    """
+    if digest is None:
+        digest = dem_hash(input_file)
+    return '%s.hs_%s_%g_%g' % (input_file, digest[:12], azimuth, altitude)
+
+
+def hillshade_array(dem, cellsize, azimuth=315., altitude=45., nodata=-9999.):
+    """
+    Hillshade of a 2D DEM array which has one cell of overlap on every side,
+    returning a float32 array two rows and two columns smaller, scaled 0-255.
+    Cells with nodata in their neighbourhood are set to HILLSHADE_NODATA.
+    """
+    dem = np.asarray(dem, dtype=np.float64)
+    rows, cols = dem.shape[0] - 2, dem.shape[1] - 2
+
+    def shifted(r, c):
+        return dem[r:r + rows, c:c + cols]
+
+    #Horn's method, rows increase to the south
+    dzdx = ((shifted(0, 2) + 2*shifted(1, 2) + shifted(2, 2)) -
+            (shifted(0, 0) + 2*shifted(1, 0) + shifted(2, 0))) / (8.*cellsize)
+    dzdy = ((shifted(2, 0) + 2*shifted(2, 1) + shifted(2, 2)) -
+            (shifted(0, 0) + 2*shifted(0, 1) + shifted(0, 2))) / (8.*cellsize)
+
+    slope = np.arctan(np.hypot(dzdx, dzdy))
+    aspect = np.arctan2(dzdy, -dzdx)
+
+    zenith = np.radians(90. - altitude)
+    azimuth_math = np.radians((360. - azimuth + 90.) % 360.)
+
+    shade = 255.*(np.cos(zenith)*np.cos(slope) + np.sin(zenith)*np.sin(slope)*np.cos(azimuth_math - aspect))
+    shade = np.clip(shade, 0, 255).astype(np.float32)
+
+    invalid = dem == nodata
+    if invalid.any():
+        near_nodata = np.zeros((rows, cols), dtype=bool)
+        for r in range(3):
+            for c in range(3):
+                near_nodata |= invalid[r:r + rows, c:c + cols]
+        shade[near_nodata] = HILLSHADE_NODATA
+
+    return shade
+
+
+def shade_rows(args):
+    """
+    Worker for hillshade which shades rows row_min:row_max of a DEM and writes
+    them into the output file. Edges of the DEM are extended by one cell.
+    """
+    import raster_plotter_simple as raster
+
+    input_file, output_file, row_min, row_max, azimuth, altitude = args
+
+    headers = raster.read_headers(input_file)
+    nrows, ncols = int(headers[1]), int(headers[0])
+    dem = raster.read_bin(input_file, (nrows, ncols), True, raster.raster_dtype(headers))
+
+    top = max(row_min - 1, 0)
+    bottom = min(row_max + 1, nrows)
+    block = np.pad(np.asarray(dem[top:bottom], dtype=np.float64),
+                   ((1 - (row_min - top), 1 - (bottom - row_max)), (1, 1)), mode='edge')
+
+    out = np.memmap(output_file + '.flt', dtype='<f4', mode='r+', shape=(nrows, ncols))
+    out[row_min:row_max] = hillshade_array(block, headers[4], azimuth, altitude, headers[5])
+    out.flush()
+    del out
+
+
+def hillshade(input_file, azimuth=315., altitude=45., tile_rows=TILE_ROWS, processes=None):
+    """
+    Hillshade a *.flt DEM for a sun azimuth and altitude in degrees, returning
+    the filename of the hillshade, a little endian float32 *.flt file with the
+    same extent as the DEM. If this DEM has been shaded with the same azimuth
+    and altitude before, the cached hillshade is returned straight away.
+    Hillshades of earlier versions of the DEM are deleted.
+
+    The DEM is shaded in bands of tile_rows rows across a pool of processes,
+    defaulting to one per core. Workers are only forked, as spawned workers
+    would re-run the calling script, so elsewhere the bands are shaded in turn.
+    """
+    import multiprocessing
+    import raster_plotter_simple as raster
+
+    if input_file.endswith('.flt') or input_file.endswith('.hdr'):
+        input_file = input_file[:-4]
+
+    digest = dem_hash(input_file)
+    output_file = hillshade_file(input_file, azimuth, altitude, digest)
+    if os.path.exists(output_file + '.hdr'):
+        return output_file + '.flt'
+
+    #the hash in the name has changed, so any other hillshades are of an old DEM
+    directory, name = os.path.split(input_file)
+    current = '%s.hs_%s_' % (name, digest[:12])
+    for old in os.listdir(directory or '.'):
+        if old.startswith(name + '.hs_') and not old.startswith(current):
+            os.remove(os.path.join(directory, old))
+
+    headers = raster.read_headers(input_file)
+    nrows, ncols = int(headers[1]), int(headers[0])
+
+    #size the output, the workers fill in their rows
+    with open(output_file + '.flt', 'wb') as f:
+        f.truncate(nrows*ncols*4)
+
+    tasks = [(input_file, output_file, r, min(r + tile_rows, nrows), azimuth, altitude)
+             for r in range(0, nrows, tile_rows)]
+
+    processes = min(processes or multiprocessing.cpu_count(), len(tasks))
+    if raster.can_fork() and processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            pool.map(shade_rows, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            shade_rows(task)
+
+    #the header is written last, so an unfinished hillshade is never used
+    raster.write_headers(output_file, headers[:5] + [HILLSHADE_NODATA, 'LSBFIRST'])
+
+    return output_file + '.flt'
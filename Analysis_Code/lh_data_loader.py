@@ -0,0 +1,1179 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2015 Stuart W.D Grieve 2015
+
+Developer can be contacted by s.grieve _at_ ed.ac.uk
+
+This program is free software;
+you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation;
+either version 2 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY;
+without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the
+GNU General Public License along with this program;
+if not, write to:
+Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301
+USA
+
+Shared loaders for the *_HilltopData.csv and *_PaperData.txt files generated
+by LH_Driver.cpp
+
+The csv is read in large blocks of bytes and each block is parsed with numpy,
+dropping failed traces and incomplete lines in bulk rather than splitting the
+file line by line in python.
+
+The first time a file is loaded the columns needed for plotting are parsed out
+of the csv and written as one *.npy file per column into a cache folder next to
+the csv. Subsequent loads memory map these arrays, so the text is only parsed
+again when the csv changes.
+
+Any of the data files can be gzip, bz2 or xz compressed, which is detected
+from the first bytes of the file and decompressed as it is read. Files
+compressed with bgzip are split into independent gzip members, which are
+decompressed in parallel by a pool of threads.
+
+Very large files can instead be streamed with iter_hilltop_data, which applies
+the quality filters to each chunk as it is read so that memory use depends on
+the chunk size and not the size of the file.
+
+The files of several study sites can be loaded at once with load_sites, which
+parses the files in parallel worker processes.
+
+Files which are still being written by LH_Driver.cpp can be followed with
+follow_hilltop_data, which only parses the lines appended since it was last
+called and keeps running summaries of the data read so far.
+
+Columns are given either by the name in the header line of each file, or as a
+(name, index) pair, such as the defaults, which is read from the column index
+LH_Driver.cpp writes. Just the columns which are needed are converted to numbers.
+
+Columns can be stored as float32 instead of float64 by passing
+dtype=COMPACT_DTYPE, halving the memory and disk used for very large files.
+memory_footprint reports how much memory a set of columns is using.
+
+Filters are written as a tuple of (column, operator, value) conditions, where
+the column can also be a ratio of two columns such as 'eucdist/lh'. A filter
+is compiled once into a function returning a numpy boolean mask, and the mask
+of each file is memoized so figures sharing a filter only evaluate it once.
+
+@author: SWDG
+"""
+
+import io
+import os
+import re
+import sys
+import bz2
+import gzip
+import zlib
+import struct
+import warnings
+import shutil
+import hashlib
+import operator
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from raster_plotter_simple import can_fork
+
+#lzma is not in the python 2 standard library, xz files need the backports.lzma package
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+#names given to the data used in the figures and the column index LH_Driver.cpp
+#writes each to. The names are labels for the arrays returned, the data is always
+#read from the index (see resolve_columns)
+HILLTOP_COLUMNS = [('relief', 4), ('lh', 5), ('slope', 8), ('eucdist', 13)]
+
+#hillslope lengths from hilltop flow routing, slope-area and drainage density in the paperdata files
+PAPER_COLUMNS = [('hfr_lh', 2), ('sa_lh', 9), ('dd_lh', 11)]
+
+#paperdata hillslope lengths at or below this are not valid measurements
+PAPER_MIN_LH = 2.0
+
+#number of bytes from each end of the file hashed into the cache stamp
+STAMP_BYTES = 65536
+
+#size of the blocks of text the csv files are parsed in
+BLOCK_BYTES = 8*1024*1024
+
+#np.loadtxt was rewritten in C in numpy 1.23, older versions split each line in python
+FAST_LOADTXT = np.lib.NumpyVersion(np.__version__) >= '1.23.0'
+
+#leading bytes identifying each supported type of compressed file
+COMPRESSION_MAGIC = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+
+#compact storage type for the columns of very large files. float32 keeps 7 significant
+#figures, well beyond the precision of the lengths and reliefs measured from a DEM
+COMPACT_DTYPE = np.float32
+
+#number of rows of cached data filtered at a time when streaming
+CHUNK_ROWS = 1048576
+
+#quality filters used in the paper. lh and relief below 2 m are probably artifacts
+HILLTOP_FILTER = (('lh', '>', 2.0), ('relief', '>', 2.0), ('slope', '<', 1.2))
+
+#as above, also removing traces whose euclidean length is not within 1e-4 of their flow length
+HILLTOP_FILTER_EUCDIST = HILLTOP_FILTER + (('eucdist/lh', '>', 0.9999), ('eucdist/lh', '<', 1.0001))
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt,
+             '<=': operator.le, '==': operator.eq, '!=': operator.ne}
+
+#compiled filters keyed by filter, and masks keyed by file, file stamp and filter
+COMPILED_FILTERS = {}
+MASKS = {}
+
+#paperdata already loaded by this process, keyed by file, size and modification time
+PAPER_DATA = {}
+
+#largest number of hilltops the critical slope is fitted to on each refresh of a followed file
+FOLLOW_FIT_ROWS = 100000
+
+#sign bit of a float64, used to order floats by their bit patterns
+SIGN_BIT = 1 << 63
+
+
+def cache_folder(filename, dtype=np.float64):
+    """
+    Path of the folder used to cache the columns of a data file. Columns stored
+    as anything other than float64 are cached in a separate folder.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        return filename + '.cache'
+    return filename + '.' + dtype.name + '.cache'
+
+
+def file_stamp(filename):
+    """
+    Build a string identifying the current state of a file from its size,
+    modification time and a hash of its first and last few kilobytes. Used to
+    invalidate cached columns when the source file is changed.
+    """
+    stats = os.stat(filename)
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        md5.update(f.read(STAMP_BYTES))
+        if stats.st_size > STAMP_BYTES:
+            f.seek(max(STAMP_BYTES, stats.st_size - STAMP_BYTES))
+            md5.update(f.read())
+
+    return '%d %r %s' % (stats.st_size, stats.st_mtime, md5.hexdigest())
+
+
+def read_stamp(folder):
+    """
+    The stamp of the file a cache folder was built from, or None if there is no
+    complete cache in the folder.
+    """
+    try:
+        with open(os.path.join(folder, 'stamp.txt'), 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def cache_is_valid(filename, names, dtype=np.float64):
+    """
+    Check that a cache folder exists for filename, that it was built from the
+    current version of the file and that it holds every requested column.
+    """
+    folder = cache_folder(filename, dtype)
+    stamp = read_stamp(folder)
+
+    if stamp is None or stamp != file_stamp(filename):
+        return False
+
+    for name in names:
+        if not os.path.exists(os.path.join(folder, name + '.npy')):
+            return False
+
+    return True
+
+
+def open_column_cache(filename, stamp, dtype=np.float64):
+    """
+    Prepare the cache folder of filename to be written, returning its path. The
+    stamp file is removed until the write is complete, and columns cached from
+    an older version of the file are removed.
+    """
+    folder = cache_folder(filename, dtype)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    old_stamp = read_stamp(folder)
+    stamp_file = os.path.join(folder, 'stamp.txt')
+    if os.path.exists(stamp_file):
+        os.remove(stamp_file)
+
+    if old_stamp != stamp:
+        for name in os.listdir(folder):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(folder, name))
+
+    return folder
+
+
+def write_column_cache(filename, columns, stamp, dtype=np.float64):
+    """
+    Write a dict of 1D arrays into the cache folder of filename as *.npy files.
+    stamp should be taken with file_stamp() before the file was parsed. It is
+    written last so that an interrupted write is never read back as a valid
+    cache.
+    """
+    folder = open_column_cache(filename, stamp, dtype)
+
+    for name, values in columns.items():
+        np.save(os.path.join(folder, name + '.npy'), values)
+
+    with open(os.path.join(folder, 'stamp.txt'), 'w') as f:
+        f.write(stamp)
+
+
+def read_column_cache(filename, names, dtype=np.float64):
+    """
+    Memory map the cached columns of filename. Returns None if the cache is
+    missing or out of date.
+    """
+    if not cache_is_valid(filename, names, dtype):
+        return None
+
+    folder = cache_folder(filename, dtype)
+    return dict((name, np.load(os.path.join(folder, name + '.npy'), mmap_mode='r'))
+                for name in names)
+
+
+def compression(filename):
+    """
+    Identify the compression of a file from its first few bytes, returning
+    'gzip', 'bz2', 'xz' or None for an uncompressed file.
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+
+    for prefix, kind in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return kind
+    return None
+
+
+def open_data(filename):
+    """
+    Open a data file for reading in binary mode, decompressing it on the fly if
+    it is gzip, bz2 or xz compressed.
+    """
+    kind = compression(filename)
+
+    if kind == 'gzip':
+        return gzip.GzipFile(filename, 'rb')
+    if kind == 'bz2':
+        return bz2.BZ2File(filename, 'rb')
+    if kind == 'xz':
+        if lzma is None:
+            raise ImportError('Reading ' + filename + ' needs the lzma module (pip install backports.lzma)')
+        return lzma.LZMAFile(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def bgzf_block_size(header):
+    """
+    Total compressed size of a bgzip block, from its 18 byte gzip header.
+    Returns None if the header is not that of a bgzip block.
+    """
+    if len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04' or header[12:16] != b'BC\x02\x00':
+        return None
+    return struct.unpack('<H', header[16:18])[0] + 1
+
+
+def iter_bgzf_groups(f, group_bytes):
+    """
+    Generator which reads a bgzip compressed file as byte strings of roughly
+    group_bytes, each holding a whole number of compressed blocks so that they
+    can be decompressed independently of one another.
+    """
+    group = []
+    size = 0
+    while True:
+        header = f.read(18)
+        if not header:
+            break
+        block_size = bgzf_block_size(header)
+        if block_size is None:
+            raise IOError('Corrupt bgzip block at byte ' + str(f.tell() - len(header)))
+        group.append(header + f.read(block_size - 18))
+        size += block_size
+        if size >= group_bytes:
+            yield b''.join(group)
+            group = []
+            size = 0
+    if group:
+        yield b''.join(group)
+
+
+def inflate_members(data):
+    """
+    Decompress a byte string made up of one or more complete gzip members.
+    """
+    chunks = []
+    while data:
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks.append(inflater.decompress(data) + inflater.flush())
+        data = inflater.unused_data
+    return b''.join(chunks)
+
+
+def read_chunks(filename, block_size=BLOCK_BYTES, threads=None):
+    """
+    Generator yielding the decompressed contents of a data file as byte strings
+    of roughly block_size bytes.
+
+    bgzip files are decompressed by a pool of threads, as zlib releases the GIL
+    while it works. Only a few groups of blocks are held at once so memory use
+    does not grow with the size of the file. Other gzip files can only be
+    decompressed one member after another and are read serially.
+    """
+    with open(filename, 'rb') as f:
+        bgzf = bgzf_block_size(f.read(18)) is not None
+
+    if not bgzf:
+        with open_data(filename) as f:
+            while True:
+                chunk = f.read(block_size)
+                if not chunk:
+                    break
+                yield chunk
+        return
+
+    threads = threads or multiprocessing.cpu_count()
+    pool = ThreadPool(threads)
+    try:
+        with open(filename, 'rb') as f:
+            #compressed text is typically a quarter of the size of the text
+            pending = deque()
+            for group in iter_bgzf_groups(f, max(1, block_size // 4)):
+                pending.append(pool.apply_async(inflate_members, (group,)))
+                if len(pending) > threads:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iter_blocks(chunks):
+    """
+    Join an iterable of byte strings into blocks which always end on a complete
+    line. Anything after the last newline is yielded as a final block.
+    """
+    remainder = b''
+    for chunk in chunks:
+        block = remainder + chunk
+        end = block.rfind(b'\n') + 1
+        remainder = block[end:]
+        if end:
+            yield block[:end]
+    if remainder:
+        yield remainder
+
+
+def split_fields(block):
+    """
+    Locate the comma separated fields of a block of text which ends with a
+    newline. Returns the index of the separator (comma or newline) which ends
+    each field, the index of the newline which ends each line, the number of
+    fields on each line and a boolean array flagging the failed traces.
+    """
+    buf = np.frombuffer(block, dtype=np.uint8)
+
+    seps = np.flatnonzero((buf == ord(',')) | (buf == ord('\n')))
+    newlines = np.flatnonzero(buf[seps] == ord('\n'))
+    counts = np.diff(np.concatenate(([-1], newlines)))
+    ends = seps[newlines]
+
+    failed = np.zeros(len(ends), dtype=bool)
+    fails = [m.start() for m in re.finditer(b'fail', block)]
+    if fails:
+        failed[np.searchsorted(ends, fails)] = True
+
+    return seps, ends, counts, failed
+
+
+def join_lines(block, ends, good):
+    """
+    Join the runs of good lines in a block of text, skipping the bad lines
+    between them. ends is the index of the newline ending each line.
+    """
+    if good.all():
+        return block
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pieces = []
+    previous = 0
+    for i in np.flatnonzero(~good):
+        pieces.append(block[previous:starts[i]])
+        previous = ends[i] + 1
+    pieces.append(block[previous:])
+
+    return b''.join(pieces)
+
+
+def gather_fields(block, seps, ends, good, counts, n_fields, usecols):
+    """
+    Gather the bytes of the fields in columns usecols of the good lines of a
+    block into a single buffer of comma separated values. counts is the number
+    of fields on each line.
+    """
+    n_rows = int(good.sum())
+    if not good.all():
+        seps = seps[np.repeat(good, counts)]
+    seps = seps.reshape(n_rows, n_fields)
+
+    #each field runs from the byte after the previous separator up to and including its own separator
+    starts = np.empty_like(seps)
+    starts[:, 1:] = seps[:, :-1] + 1
+    starts[:, 0] = np.concatenate(([0], ends[:-1] + 1))[good]
+
+    starts = starts[:, usecols].ravel()
+    lengths = seps[:, usecols].ravel() + 1 - starts
+
+    offsets = np.cumsum(lengths)
+    index = np.arange(offsets[-1]) + np.repeat(starts - offsets + lengths, lengths)
+    text = np.frombuffer(block, dtype=np.uint8)[index]
+    text[offsets - 1] = ord(',')
+
+    return text.tobytes()
+
+
+def drop_failed(block):
+    """
+    Remove the failed traces from a block of text which ends with a newline,
+    returning the remaining text and its number of lines.
+    """
+    ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+    fails = [m.start() for m in re.finditer(b'fail', block)]
+    if not fails:
+        return block, len(ends)
+
+    good = np.ones(len(ends), dtype=bool)
+    good[np.searchsorted(ends, fails)] = False
+    return join_lines(block, ends, good), int(good.sum())
+
+
+def load_block(block, n_fields):
+    """
+    Parse every column of a block of text which ends with a newline with the C
+    tokenizer of np.loadtxt, after dropping the failed traces. Returns None if
+    any other line does not have exactly n_fields values, so that parse_block
+    can drop them.
+    """
+    text, n_rows = drop_failed(block)
+    if n_rows == 0 or text.startswith(b'\n') or b'\n\n' in text:
+        return None
+
+    try:
+        values = np.loadtxt(io.BytesIO(text), delimiter=',', ndmin=2, comments=None)
+    except ValueError:
+        return None
+
+    if values.shape != (n_rows, n_fields):
+        return None
+    return values
+
+
+def parse_block(block, n_fields, usecols=None):
+    """
+    Parse the values in the columns usecols (default all columns) from every
+    line of a block of text which has exactly n_fields comma separated values.
+    Failed traces, blank lines and lines truncated by a file which has not
+    finished being written are all dropped. Returns a 2D float64 array with one
+    row per good line.
+
+    When usecols is given only the bytes of the requested columns are gathered
+    and converted to floats, so unused columns cost almost nothing to skip.
+    This is faster than np.loadtxt, which tokenizes every column. When every
+    column is wanted and numpy has a C np.loadtxt, load_block is used instead.
+    """
+    block = block.replace(b'\r', b'')
+    if not block.endswith(b'\n'):
+        block = block + b'\n'
+
+    if FAST_LOADTXT and usecols is None:
+        values = load_block(block, n_fields)
+        if values is not None:
+            return values
+
+    seps, ends, counts, failed = split_fields(block)
+    good = (counts == n_fields) & ~failed
+    n_rows = int(good.sum())
+    n_cols = n_fields if usecols is None else len(usecols)
+
+    if n_rows == 0:
+        return np.empty((0, n_cols))
+
+    if usecols is None:
+        text = join_lines(block, ends, good).replace(b'\n', b',')
+    else:
+        text = gather_fields(block, seps, ends, good, counts, n_fields, usecols)
+
+    values = np.fromstring(text, dtype=np.float64, sep=',')
+    if len(values) != n_rows*n_cols:
+        raise ValueError('Could not parse the numeric data in the hilltop data file')
+
+    return values.reshape(n_rows, n_cols)
+
+
+def read_header(filename):
+    """
+    Read the comma or whitespace separated header line of a data file,
+    returning a list of unique column names. Blank or repeated names are
+    suffixed with their index.
+    """
+    with open_data(filename) as f:
+        header = f.readline().decode('ascii', 'replace')
+
+    if ',' in header:
+        fields = header.strip().split(',')
+    else:
+        fields = header.split()
+
+    names = []
+    for i, name in enumerate(fields):
+        name = name.strip()
+        if not name or name in names:
+            name = name + '_' + str(i)
+        names.append(name)
+
+    return names
+
+
+def resolve_columns(filename, columns):
+    """
+    Find the offsets of columns in a data file from its header line, returning
+    a list of (name, offset) tuples. Names are matched ignoring case.
+
+    Each entry of columns is either a column name, which must be in the header,
+    or a (name, index) tuple which is always read from column index. The name
+    of a tuple only labels the data, but as a header holding that name in
+    another column suggests the file is not laid out as expected, a warning is
+    given when that happens.
+    """
+    header = {}
+    for i, name in enumerate(read_header(filename)):
+        header.setdefault(name.lower(), i)
+
+    resolved = []
+    for column in columns:
+        if isinstance(column, tuple):
+            name, offset = column
+            if header.get(name.lower(), offset) != offset:
+                warnings.warn('%s has a column named %s at index %d, but index %d is read. Pass the name on its '
+                              'own to read the named column' % (filename, name, header[name.lower()], offset))
+        else:
+            name, offset = column, header.get(column.lower())
+            if offset is None:
+                raise ValueError(filename + ' has no column named ' + name)
+        resolved.append((name, offset))
+
+    return resolved
+
+
+def count_fields(block):
+    """
+    Find the most common number of fields per line in a block of text, which
+    is taken as the number of columns in the file. Returns None if the block
+    has no complete lines.
+    """
+    block = block.replace(b'\r', b'').rstrip(b'\n') + b'\n'
+    _, _, counts, failed = split_fields(block)
+    counts = counts[(counts > 1) & ~failed]
+
+    if len(counts) == 0:
+        return None
+    return int(np.bincount(counts).argmax())
+
+
+def iter_parsed_blocks(filename, usecols=None, block_size=BLOCK_BYTES):
+    """
+    Generator which parses a hilltopdata file one block at a time, yielding a
+    2D float64 array of the columns usecols (default all columns) for the good
+    lines of each block. See parse_block.
+
+    The number of columns is taken from the most common line length in the
+    first block of the file, so a header which does not match the data does
+    not cause every line to be dropped.
+    """
+    n_fields = None
+    header = True
+
+    for block in iter_blocks(read_chunks(filename, block_size)):
+        if header:
+            end = block.find(b'\n')
+            block = block[end + 1:] if end >= 0 else b''
+            header = False
+            if not block:
+                continue
+        if n_fields is None:
+            n_fields = count_fields(block)
+            if n_fields is None:
+                continue
+            if usecols is not None and max(usecols) >= n_fields:
+                raise ValueError(filename + ' has fewer columns than expected for a hilltop data file')
+        yield parse_block(block, n_fields, usecols)
+
+
+def parse_hilltop_data(filename, usecols=None, block_size=BLOCK_BYTES):
+    """
+    Parse a hilltopdata file into a numpy structured array with one float64
+    field per column, named from the header line. Failed traces and incomplete
+    lines at the end of files which are still being written are skipped.
+
+    usecols is a list of column indexes or header names to parse, by default
+    every column is parsed.
+    """
+    names = read_header(filename)
+    if usecols is not None:
+        offsets = dict(resolve_columns(filename, [i for i in usecols if not isinstance(i, (int, np.integer))]))
+        usecols = [offsets.get(i, i) for i in usecols]
+    blocks = list(iter_parsed_blocks(filename, usecols, block_size))
+
+    if blocks and usecols is None:
+        n_fields = blocks[0].shape[1]
+    else:
+        n_fields = max([len(names)] + [i + 1 for i in usecols or []])
+
+    #pad or trim the header names to match the data
+    names = names[:n_fields] + ['col_' + str(i) for i in range(len(names), n_fields)]
+    if usecols is not None:
+        names = [names[i] for i in usecols]
+    dtype = np.dtype([(str(name), np.float64) for name in names])
+
+    if not blocks:
+        return np.empty(0, dtype=dtype)
+
+    values = np.ascontiguousarray(np.concatenate(blocks))
+    return values.view(dtype).reshape(-1)
+
+
+def build_column_cache(filename, columns=HILLTOP_COLUMNS, dtype=np.float64):
+    """
+    Parse the columns of a hilltopdata file straight into its cache folder. Each
+    block is appended to a raw file per column as it is parsed, and the *.npy
+    header is only added once the number of rows is known, so memory use is set
+    by the block size and not the size of the file.
+    """
+    columns = resolve_columns(filename, columns)
+    stamp = file_stamp(filename)
+    folder = open_column_cache(filename, stamp, dtype)
+    dtype = np.dtype(dtype)
+
+    parts = dict((name, open(os.path.join(folder, name + '.part'), 'wb')) for name, _ in columns)
+    n_rows = 0
+    try:
+        for block in iter_parsed_blocks(filename, [i for _, i in columns]):
+            for j, (name, _) in enumerate(columns):
+                parts[name].write(np.ascontiguousarray(block[:, j], dtype=dtype).tobytes())
+            n_rows += len(block)
+    finally:
+        for f in parts.values():
+            f.close()
+
+    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (n_rows,)}
+    for name, _ in columns:
+        part = os.path.join(folder, name + '.part')
+        with open(os.path.join(folder, name + '.npy'), 'wb') as f:
+            np.lib.format.write_array_header_1_0(f, header)
+            with open(part, 'rb') as raw:
+                shutil.copyfileobj(raw, f, BLOCK_BYTES)
+        os.remove(part)
+
+    with open(os.path.join(folder, 'stamp.txt'), 'w') as f:
+        f.write(stamp)
+
+
+def compile_filter(conditions):
+    """
+    Compile a filter, a sequence of (column, operator, value) conditions which
+    must all be true, into a function which takes a dict of column arrays and
+    returns a boolean mask. The column may be a ratio of two columns written as
+    'numerator/denominator' and the operator is one of >, >=, <, <=, == or !=.
+
+    Compiled filters are memoized, so compiling the same filter twice is free.
+    """
+    conditions = tuple(tuple(c) for c in conditions)
+    if conditions in COMPILED_FILTERS:
+        return COMPILED_FILTERS[conditions]
+
+    tests = []
+    for column, op, value in conditions:
+        if op not in OPERATORS:
+            raise ValueError('Unknown operator ' + repr(op) + ' in hilltop filter')
+        tests.append((column, OPERATORS[op], value))
+
+    def mask_function(data):
+        mask = np.ones(len(list(data.values())[0]), dtype=bool)
+        ratios = {}
+        for column, compare, value in tests:
+            if '/' in column:
+                #each ratio is only computed once, however many conditions use it
+                if column not in ratios:
+                    numerator, denominator = column.split('/')
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        ratios[column] = data[numerator]/data[denominator]
+                values = ratios[column]
+            else:
+                values = data[column]
+            mask &= compare(values, value)
+        return mask
+
+    COMPILED_FILTERS[conditions] = mask_function
+    return mask_function
+
+
+def hilltop_mask(filename, conditions=HILLTOP_FILTER_EUCDIST, columns=HILLTOP_COLUMNS, dtype=np.float64):
+    """
+    Boolean mask of the hilltops of a hilltopdata file which pass a filter.
+    Masks are memoized against the file stamp, so a filter shared by several
+    figures is only evaluated once per file while the file is unchanged.
+    """
+    conditions = tuple(tuple(c) for c in conditions)
+    key = (os.path.abspath(filename), file_stamp(filename), conditions, np.dtype(dtype).str)
+
+    if key not in MASKS:
+        data = load_hilltop_data(filename, columns, dtype)
+        MASKS[key] = compile_filter(conditions)(data)
+
+    return MASKS[key]
+
+
+def filter_hilltop_data(filename, conditions=HILLTOP_FILTER_EUCDIST, columns=HILLTOP_COLUMNS, dtype=np.float64):
+    """
+    Load the columns of a hilltopdata file, keeping only the hilltops which
+    pass a filter. Returns a dict of arrays keyed by column name.
+    """
+    data = load_hilltop_data(filename, columns, dtype)
+    mask = hilltop_mask(filename, conditions, columns, dtype)
+
+    return dict((name, np.array(values[mask])) for name, values in data.items())
+
+
+def iter_hilltop_data(filename, conditions=HILLTOP_FILTER_EUCDIST, columns=HILLTOP_COLUMNS,
+                      block_size=BLOCK_BYTES, dtype=np.float64):
+    """
+    Generator which streams a hilltopdata file in chunks, yielding a dict of
+    arrays keyed by column name holding only the hilltops in each chunk which
+    pass the filter. Peak memory is set by the chunk size rather than the size
+    of the file.
+
+    If an up to date column cache exists the chunks are sliced from the memory
+    mapped cache, otherwise the csv is parsed block by block.
+    """
+    columns = resolve_columns(filename, columns)
+    names = [name for name, _ in columns]
+    mask_function = compile_filter(conditions)
+
+    cached = read_column_cache(filename, names, dtype)
+    if cached is not None:
+        n_rows = len(cached[names[0]])
+        for start in range(0, n_rows, CHUNK_ROWS):
+            chunk = dict((name, values[start:start + CHUNK_ROWS]) for name, values in cached.items())
+            mask = mask_function(chunk)
+            yield dict((name, np.array(values[mask])) for name, values in chunk.items())
+        return
+
+    for block in iter_parsed_blocks(filename, [i for _, i in columns], block_size):
+        chunk = dict((name, block[:, j]) for j, name in enumerate(names))
+        mask = mask_function(chunk)
+        yield dict((name, block[mask, j].astype(dtype)) for j, name in enumerate(names))
+
+
+def load_hilltop_data(filename, columns=HILLTOP_COLUMNS, dtype=np.float64):
+    """
+    Load the columns of a hilltopdata file as a dict of arrays of type dtype
+    keyed by column name. The csv is only parsed if there is no up to date
+    cache of it, and the returned arrays are read only memory maps of the
+    cached *.npy files.
+    """
+    columns = resolve_columns(filename, columns)
+    names = [name for name, _ in columns]
+
+    cached = read_column_cache(filename, names, dtype)
+    if cached is not None:
+        return cached
+
+    build_column_cache(filename, columns, dtype)
+
+    #the file may have been appended to while it was parsed, which leaves the
+    #cache out of date, but the columns just written are still returned
+    folder = cache_folder(filename, dtype)
+    return dict((name, np.load(os.path.join(folder, name + '.npy'), mmap_mode='r'))
+                for name in names)
+
+
+def load_paper_data(filename, columns=PAPER_COLUMNS, dtype=np.float64):
+    """
+    Load the hfr, slope-area and drainage density hillslope lengths from a
+    paperdata file as a dict of arrays keyed by column name. For each column
+    a boolean mask of the valid values, greater than PAPER_MIN_LH, is stored
+    under the column name with '_valid' appended, eg data['sa_lh_valid'].
+
+    The columns and masks are cached on disk next to the file, and each file is
+    only loaded once per process so every histogram figure drawn in the same
+    session shares the same arrays.
+    """
+    stats = os.stat(filename)
+    key = (os.path.abspath(filename), stats.st_size, stats.st_mtime, tuple(columns), np.dtype(dtype).str)
+    if key in PAPER_DATA:
+        return PAPER_DATA[key]
+
+    columns = resolve_columns(filename, columns)
+    names = [name for name, _ in columns]
+    names = names + [name + '_valid' for name in names]
+
+    data = read_column_cache(filename, names, dtype)
+    if data is None:
+        stamp = file_stamp(filename)
+        with open_data(filename) as f:
+            values = np.loadtxt(f, skiprows=1, usecols=[i for _, i in columns], ndmin=2)
+
+        #the valid masks are taken from the float64 values so they do not depend on dtype
+        data = {}
+        for j, (name, _) in enumerate(columns):
+            data[name] = np.ascontiguousarray(values[:, j], dtype=dtype)
+            data[name + '_valid'] = values[:, j] > PAPER_MIN_LH
+        write_column_cache(filename, data, stamp, dtype)
+
+    PAPER_DATA[key] = data
+    return data
+
+
+def memory_footprint(data):
+    """
+    Memory used by a dict of column arrays, returned as a tuple of the bytes
+    held by the arrays and the bytes the same values would take as python lists
+    of floats, which is how the hilltop data used to be read.
+    """
+    n_bytes = sum(values.nbytes for values in data.values())
+    n_values = sum(values.size for values in data.values())
+    list_bytes = n_values * (sys.getsizeof(1.0) + struct.calcsize('P'))
+    return n_bytes, list_bytes
+
+
+def lh_relief_model(lh, Sc, DD, EE, pr, ps):
+    """
+    Relief predicted from hillslope length for a critical slope Sc, diffusivity
+    DD, erosion rate EE and rock and soil densities pr and ps. This is equation
+    10 from Grieve et al 2015, based on work in Roering 2007.
+    """
+    A = (2.*EE*pr)/(DD*Sc*ps)
+    return (Sc * (-1. + np.sqrt(1 + A**2. * lh**2.) + np.log(3.) - np.log(2. + np.sqrt(1. + A**2. * lh**2.))))/A
+
+
+def add_sorted_run(runs, values):
+    """
+    Add an array of values to a list of sorted arrays (runs), merging runs of
+    similar length so there are only O(log(n)) of them. Each value is merged
+    O(log(n)) times in all, so adding a block of values costs amortised
+    O(len(values)*log(n)) rather than the O(n) of inserting into one sorted array.
+    """
+    runs.append(np.sort(values))
+    while len(runs) > 1 and len(runs[-2]) <= 2*len(runs[-1]):
+        merged = np.concatenate((runs.pop(), runs.pop()))
+        merged.sort(kind='mergesort')
+        runs.append(merged)
+    return runs
+
+
+def float_key(x):
+    """
+    Map a float64 to an integer with the same ordering, so floats can be bisected
+    one representable value at a time.
+    """
+    bits = int(np.array(x, dtype=np.float64).view(np.uint64))
+    return -(bits & (SIGN_BIT - 1)) if bits & SIGN_BIT else bits
+
+
+def key_float(key):
+    """
+    Inverse of float_key.
+    """
+    bits = key if key >= 0 else (-key) | SIGN_BIT
+    return float(np.array(bits, dtype=np.uint64).view(np.float64))
+
+
+def smallest_float(lo, hi, test):
+    """
+    Smallest float64 x between lo and hi for which test(x) is true, given that
+    test is false below some value and true from it upwards and test(hi) is
+    true. Takes at most 64 calls of test.
+    """
+    lo, hi = float_key(lo), float_key(hi)
+    while lo < hi:
+        mid = (lo + hi)//2
+        if test(key_float(mid)):
+            hi = mid
+        else:
+            lo = mid + 1
+    return key_float(lo)
+
+
+def runs_median(runs):
+    """
+    Median of the values held in a list of sorted arrays, matching np.median of
+    all of them. Each of the two middle values is found by bisecting the float
+    values, counting the values at or below each guess with searchsorted, so
+    this costs O(log(n)**2) and never joins the runs.
+    """
+    n = sum(len(run) for run in runs)
+    lo = min(run[0] for run in runs)
+    hi = max(run[-1] for run in runs)
+
+    def kth(k):
+        return smallest_float(lo, hi, lambda x: sum(np.searchsorted(run, x, 'right') for run in runs) > k)
+
+    return 0.5*(kth((n - 1)//2) + kth(n//2))
+
+
+def count_within(run, median, t):
+    """
+    Number of values v in the sorted array run with abs(v - median) <= t. The
+    bounds from searchsorted are moved past the few values where median +/- t
+    rounds differently to v - median, so the count matches the residuals exactly.
+    """
+    upper = np.searchsorted(run, median + t, 'right')
+    while upper < len(run) and run[upper] - median <= t:
+        upper = np.searchsorted(run, run[upper], 'right')
+    while upper > 0 and run[upper - 1] - median > t:
+        upper = np.searchsorted(run, run[upper - 1], 'left')
+
+    lower = np.searchsorted(run, median - t, 'left')
+    while lower > 0 and median - run[lower - 1] <= t:
+        lower = np.searchsorted(run, run[lower - 1], 'left')
+    while lower < len(run) and median - run[lower] > t:
+        lower = np.searchsorted(run, run[lower], 'right')
+
+    return max(upper - lower, 0)
+
+
+def runs_mad(runs, median):
+    """
+    Median absolute deviation from median of the values in a list of sorted
+    arrays, matching np.median(np.abs(values - median)). The residuals are
+    bisected in the same way as runs_median, using count_within.
+    """
+    n = sum(len(run) for run in runs)
+    hi = max(max(median - run[0], run[-1] - median) for run in runs)
+
+    def kth(k):
+        return smallest_float(0., hi, lambda t: sum(count_within(run, median, t) for run in runs) > k)
+
+    return 0.5*(kth((n - 1)//2) + kth(n//2))
+
+
+def head_stamp(filename, n_bytes):
+    """
+    Identify the start of a file, from its inode and a hash of its first n_bytes.
+    Used to tell when a followed file has been replaced or rewritten.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(n_bytes)
+    return (os.stat(filename).st_ino, len(head), hashlib.md5(head).hexdigest())
+
+
+def append_rows(buffer, n_rows, values):
+    """
+    Append values to the first n_rows of a buffer array, doubling the size of
+    the buffer when it is full so that repeated appends are amortised O(1).
+    """
+    if n_rows + len(values) > len(buffer):
+        grown = np.empty(max(2*len(buffer), n_rows + len(values)), dtype=buffer.dtype)
+        grown[:n_rows] = buffer[:n_rows]
+        buffer = grown
+    buffer[n_rows:n_rows + len(values)] = values
+    return buffer
+
+
+def follow_hilltop_data(filename, state=None, conditions=HILLTOP_FILTER_EUCDIST,
+                        columns=HILLTOP_COLUMNS, sc_params=None):
+    """
+    Incrementally read a hilltopdata file which is still being written by
+    LH_Driver.cpp. Pass in the state returned by the previous call (or None the
+    first time) and only the complete lines appended to the file since then are
+    parsed. Incomplete lines at the end of the file are left for the next call.
+
+    The hilltops passing the filter are accumulated and the returned state holds
+    the running summaries of them:
+
+        state['data'] - dict of the filtered columns read so far
+        state['median'], state['mad'] - median and MAD of the hillslope lengths
+        state['sc'] - best fit critical slope, if sc_params is given
+
+    sc_params is a tuple of (DD, EE, pr, ps) used to fit lh_relief_model to the
+    data. The fit is started from the previous best fit, and uses at most
+    FOLLOW_FIT_ROWS hilltops evenly spaced through those read so far, so each
+    refresh costs the same however large the file grows.
+
+    The hillslope lengths are kept as a few sorted runs (see add_sorted_run),
+    so the median and MAD are updated in amortised O(log(n)) time per new
+    hilltop. Only the filtered columns themselves grow with the file.
+
+    If the file has been truncated, replaced or rewritten, which is detected
+    from its inode and a hash of its first STAMP_BYTES, it is read again from
+    the start. Until the header line of the file is complete nothing is read,
+    and the state returned holds no data.
+    """
+    if compression(filename) is not None:
+        raise ValueError(filename + ' is compressed, only uncompressed files can be followed')
+
+    size = os.path.getsize(filename)
+
+    if state is not None and state['offset'] is not None and (
+            size < state['offset'] or head_stamp(filename, state['stamp'][1]) != state['stamp']):
+        state = None
+
+    if state is None or state['offset'] is None:
+        with open(filename, 'rb') as f:
+            header = f.readline()
+
+        #the columns can only be found once LH_Driver.cpp has finished the header line
+        if not header.endswith(b'\n'):
+            names = [column[0] if isinstance(column, tuple) else column for column in columns]
+            return {'offset': None, 'n_rows': 0, 'median': np.nan, 'mad': np.nan, 'sc': None,
+                    'data': dict((name, np.empty(0)) for name in names)}
+
+        columns = resolve_columns(filename, columns)
+        state = {'offset': len(header), 'n_fields': None, 'n_rows': 0, 'columns': columns,
+                 'buffers': dict((name, np.empty(0)) for name, _ in columns),
+                 'lh_runs': [], 'median': np.nan, 'mad': np.nan, 'sc': None,
+                 'stamp': head_stamp(filename, len(header))}
+
+    with open(filename, 'rb') as f:
+        f.seek(state['offset'])
+        block = f.read(size - state['offset'])
+
+    #only parse up to the last complete line
+    block = block[:block.rfind(b'\n') + 1]
+
+    if block:
+        if state['n_fields'] is None:
+            state['n_fields'] = count_fields(block)
+
+    if block and state['n_fields'] is not None:
+        state['offset'] += len(block)
+        if state['stamp'][1] < STAMP_BYTES:
+            state['stamp'] = head_stamp(filename, min(STAMP_BYTES, state['offset']))
+
+        columns = state['columns']
+        values = parse_block(block, state['n_fields'], [i for _, i in columns])
+        chunk = dict((name, values[:, j]) for j, (name, _) in enumerate(columns))
+        mask = compile_filter(conditions)(chunk)
+
+        n_rows = state['n_rows']
+        for name, buffer in state['buffers'].items():
+            state['buffers'][name] = append_rows(buffer, n_rows, chunk[name][mask])
+        state['n_rows'] = n_rows + int(mask.sum())
+
+        if mask.any():
+            add_sorted_run(state['lh_runs'], chunk['lh'][mask])
+            state['median'] = runs_median(state['lh_runs'])
+            state['mad'] = runs_mad(state['lh_runs'], state['median'])
+
+            if sc_params is not None:
+                import scipy.optimize as optimization
+                step = -(-state['n_rows'] // FOLLOW_FIT_ROWS)
+                lh = state['buffers']['lh'][:state['n_rows']:step]
+                relief = state['buffers']['relief'][:state['n_rows']:step]
+                init_Sc = 0.8 if state['sc'] is None else state['sc']
+                params, _ = optimization.curve_fit(lambda x, Sc: lh_relief_model(x, Sc, *sc_params), lh, relief, init_Sc)
+                state['sc'] = params[0]
+
+    state['data'] = dict((name, buffer[:state['n_rows']]) for name, buffer in state['buffers'].items())
+    return state
+
+
+def site_name(filename):
+    """
+    The study site code at the start of a data filename, eg 'NC' for
+    'nc/NC_HilltopData.csv'.
+    """
+    return os.path.basename(filename).split('_')[0]
+
+
+def site_cache(loader, filename, kwargs):
+    """
+    Check whether the disk cache loader reads for filename is up to date,
+    returning a tuple of that and the (loader, filename, kwargs) job which
+    builds it. filter_hilltop_data reads the cache of load_hilltop_data, so its
+    cache is built without making the filtered copies. Loaders which do not
+    use a column cache are always run.
+    """
+    dtype = kwargs.get('dtype', np.float64)
+
+    if loader in (load_hilltop_data, filter_hilltop_data):
+        columns = kwargs.get('columns', HILLTOP_COLUMNS)
+        names = [name for name, _ in resolve_columns(filename, columns)]
+        return (cache_is_valid(filename, names, dtype),
+                (load_hilltop_data, filename, {'columns': columns, 'dtype': dtype}))
+
+    if loader is load_paper_data:
+        names = [name for name, _ in resolve_columns(filename, kwargs.get('columns', PAPER_COLUMNS))]
+        return (cache_is_valid(filename, names + [name + '_valid' for name in names], dtype),
+                (loader, filename, kwargs))
+
+    return False, (loader, filename, kwargs)
+
+
+def cache_site(args):
+    """
+    Worker for load_sites which runs a loader to build the disk cache of a file.
+    The data itself is not returned, the parent process memory maps the cache.
+    """
+    loader, filename, kwargs = args
+    loader(filename, **kwargs)
+
+
+def load_sites(filenames, loader=load_hilltop_data, processes=None, **kwargs):
+    """
+    Load the data files of several study sites concurrently, returning a dict of
+    the result of loader(filename, **kwargs) for each file keyed by site_name.
+
+    When more than one file has no up to date cache, those files are parsed in
+    a pool of worker processes, so the time taken is set by the largest file
+    rather than the sum of all of them. The cached arrays are then read back by
+    a pool of threads. On platforms which cannot fork the files are parsed by
+    the threads instead.
+    """
+    filenames = list(filenames)
+    jobs = [job for valid, job in (site_cache(loader, filename, kwargs) for filename in filenames) if not valid]
+
+    if len(jobs) > 1 and can_fork():
+        pool = multiprocessing.Pool(min(processes or len(jobs), len(jobs)))
+        try:
+            pool.map(cache_site, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    pool = ThreadPool(max(1, len(filenames)))
+    try:
+        results = pool.map(lambda filename: loader(filename, **kwargs), filenames)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict((site_name(filename), result) for filename, result in zip(filenames, results))
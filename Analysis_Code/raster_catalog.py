@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2015 Stuart W.D Grieve 2015
+
+Developer can be contacted by s.grieve _at_ ed.ac.uk
+
+This program is free software;
+you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation;
+either version 2 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY;
+without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the
+GNU General Public License along with this program;
+if not, write to:
+Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301
+USA
+
+Catalog of the *.flt rasters in a data directory.
+
+build_catalog scans a directory and stores the header of every raster (size,
+extent, cellsize, nodata, data type and file size) in a small json index in
+that directory. The index is updated incrementally, so only rasters which are
+new or have changed since the last scan have their header read again.
+
+Rasters can then be looked up by site code or bounding box with find_rasters,
+and catalog_headers gives the header list that raster_plotter_simple expects,
+so windowed and overview reads can be planned without opening the rasters.
+
+@author: SWDG
+"""
+
+import os
+import json
+
+#name of the index file written into each data directory
+INDEX_NAME = 'raster_index.json'
+
+
+def raster_entry(input_file):
+    """
+    Build the catalog entry of a raster from its header, given its name without
+    extension.
+    """
+    import raster_plotter_simple as raster
+
+    headers = raster.read_headers(input_file)
+    dtype = raster.raster_dtype(headers)
+    ncols, nrows, xll, yll, cellsize, nodata = headers[:6]
+    name = os.path.basename(input_file)
+
+    return {'name': name,
+            'site': name.split('_')[0],
+            'path': input_file + '.flt',
+            'ncols': int(ncols),
+            'nrows': int(nrows),
+            'xllcorner': xll,
+            'yllcorner': yll,
+            'cellsize': cellsize,
+            'nodata': nodata,
+            'dtype': dtype.str,
+            'extent': [xll, xll + ncols*cellsize, yll, yll + nrows*cellsize],
+            'bytes': os.path.getsize(input_file + '.flt'),
+            'modified': os.path.getmtime(input_file + '.hdr')}
+
+
+def build_catalog(directory):
+    """
+    Scan directory for *.flt rasters with a *.hdr file, returning the catalog as
+    a dict of entries keyed by raster name and saving it as INDEX_NAME in the
+    directory. Overview levels and other cached copies are not indexed.
+    """
+    index = os.path.join(directory, INDEX_NAME)
+
+    old = {}
+    if os.path.exists(index):
+        with open(index, 'r') as f:
+            old = json.load(f)
+
+    catalog = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.flt') or '.ovr' in filename or filename.endswith('.asc.flt'):
+            continue
+        input_file = os.path.join(directory, filename[:-4])
+        if not os.path.exists(input_file + '.hdr'):
+            continue
+
+        name = filename[:-4]
+        entry = old.get(name)
+        if (entry is None or entry['modified'] != os.path.getmtime(input_file + '.hdr')
+                or entry['bytes'] != os.path.getsize(input_file + '.flt')):
+            entry = raster_entry(input_file)
+        entry['path'] = input_file + '.flt'
+        catalog[name] = entry
+
+    if catalog != old:
+        with open(index + '.part', 'w') as f:
+            json.dump(catalog, f, indent=1, sort_keys=True)
+        if os.path.exists(index):
+            os.remove(index)
+        os.rename(index + '.part', index)
+
+    return catalog
+
+
+def find_rasters(catalog, site=None, bbox=None, contains=None):
+    """
+    List the catalog entries, sorted by name, of the rasters from a site code
+    (eg 'NC'), whose name includes the string contains (eg '_HS') and which
+    overlap the UTM bounding box bbox, a tuple of (x_min, x_max, y_min, y_max).
+    Any criteria which are None are not applied.
+    """
+    found = []
+    for name in sorted(catalog):
+        entry = catalog[name]
+        if site is not None and entry['site'] != site:
+            continue
+        if contains is not None and contains not in name:
+            continue
+        if bbox is not None:
+            x_min, x_max, y_min, y_max = entry['extent']
+            if bbox[0] >= x_max or bbox[1] <= x_min or bbox[2] >= y_max or bbox[3] <= y_min:
+                continue
+        found.append(entry)
+
+    return found
+
+
+def catalog_headers(entry):
+    """
+    The header list of a catalog entry, in the format returned by
+    raster_plotter_simple.read_headers.
+    """
+    import numpy as np
+
+    dtype = np.dtype(entry['dtype'])
+    byteorder = 'MSBFIRST' if dtype.str[0] == '>' else 'LSBFIRST'
+
+    return [float(entry['ncols']), float(entry['nrows']), entry['xllcorner'], entry['yllcorner'],
+            entry['cellsize'], entry['nodata'], byteorder, dtype.name]
@@ -41,145 +41,899 @@ def round_to_n(x, n):
     return float(as_string)
 
 
+#numpy types of the ENVI data type codes
+DATA_TYPES = {1: 'u1', 2: 'i2', 3: 'i4', 4: 'f4', 5: 'f8', 12: 'u2', 13: 'u4'}
+
 def read_headers(input_file):
     """
     Read the headers of a raster, returning the header info in a list with the 
     following structure:
         
         [ncols, nrows, xllcorner, yllcorner, cellsize, NODATA_value, byteorder]
-                
+    
+    followed by the data type if the header has one.
     """
+    
+    def value(h):
+        try:
+            return float(h)
+        except ValueError:
+            return h
 
     with open(input_file+'.hdr','r') as f:   
-        return [float(h) if not h.isalpha() else h for h in [l.split()[1] for l in f.readlines()]]  #isdigit() does not catch floats      
+        return [value(l.split()[1]) for l in f.readlines() if l.strip()]
+
+def raster_dtype(headers):
+    """
+    The numpy dtype of the data described by a header list. The byte order is 
+    taken from the byteorder entry (LSBFIRST or MSBFIRST) and the type from the 
+    optional data type entry after it, which can be an ENVI data type code (eg 2
+    for int16) or a numpy type name (eg uint8). Headers without these entries 
+    are little endian float32.
+    """
+    import numpy as np
+    
+    byteorder = str(headers[6]).upper() if len(headers) > 6 else 'LSBFIRST'
+    order = '>' if byteorder in ('MSBFIRST', 'M') else '<'
+    
+    if len(headers) > 7:
+        if isinstance(headers[7], float):
+            kind = DATA_TYPES[int(headers[7])]
+        else:
+            kind = np.dtype(headers[7].lower()).str[1:]
+    else:
+        kind = 'f4'
 
-def read_bin(filename):
+    return np.dtype(order + kind)
+
+def read_bin(filename, shape=None, mmap=False, dtype='<f4'):
     """
     Method to read the binary data from an flt file, called by the wrapper.
+    The data is read straight into an array of the given shape, or if mmap is
+    True the file is memory mapped as a read only array instead, so no data is
+    read until it is used.
+    
+    dtype gives the type and byte order of the file (see raster_dtype), the 
+    array keeps this byte order so the data is never copied to swap bytes.
     """
-    import sys
     import numpy as np
 
+    if mmap:
+        return np.memmap(filename + '.flt', dtype=dtype, mode='r', shape=shape)
+
     with open(filename + '.flt', "rb") as f:
-        raster_data = np.fromstring(f.read(), 'f')
+        raster_data = np.fromfile(f, dtype)
 
-    if sys.byteorder == 'big':
-        raster_data = raster_data.byteswap()  #ensures data is little endian
+    if shape is not None:
+        raster_data = raster_data.reshape(shape)
 
     return raster_data
     
-def read_flt(input_file):
+def read_flt(input_file, mmap=False):
     """
     Wrapper method to read the header and data of a *.flt file. Pass in a filename
     amd it returns the data as a 2D numpy array and the header data as a list.
+    
+    Set mmap to True to get a read only memory mapped array, which costs no memory
+    or time until the pixels are used. Useful for large rasters which are only 
+    partly plotted.
     """
 
     if input_file.endswith('.flt') or input_file.endswith('.hdr'):
         input_file = input_file[:-4]    
     else:
-        print 'Incorrect filename'
+        print('Incorrect filename')
         return 0,0 #exits module gracefully
     
     headers = read_headers(input_file)
     
-    #read the data as a 1D array and reshape it to the dimensions in the header
-    raster_array = read_bin(input_file).reshape(headers[1], headers[0]) 
-    raster_array = raster_array.reshape(headers[1], headers[0]) #rows, columns
+    #read the data in the dimensions given in the header
+    raster_array = read_bin(input_file, (int(headers[1]), int(headers[0])), mmap, raster_dtype(headers)) #rows, columns
 
     return raster_array, headers
 
-def read_ascii_raster(ascii_raster_file):
+def window_bounds(headers, rows=None, cols=None, bbox=None):
+    """
+    Convert a window of a raster into row and column bounds, clipped to the edges
+    of the raster. The window is given either as rows and cols, each a tuple of 
+    (min, max) indexes, or as bbox, a tuple of UTM (x_min, x_max, y_min, y_max).
+    Any bound not given is the full extent of the raster.
+    
+    Returns (row_min, row_max, col_min, col_max), where the max values are 
+    exclusive as in a python slice.
+    """
+    import math
+    
+    ncols = int(headers[0])
+    nrows = int(headers[1])
+
+    if bbox is not None:
+        x_min, x_max, y_min, y_max = bbox
+        top = headers[3] + nrows*headers[4] #UTM y of the top edge of the raster
+        cols = (int(math.floor((x_min - headers[2])/headers[4])), int(math.ceil((x_max - headers[2])/headers[4])))
+        rows = (int(math.floor((top - y_max)/headers[4])), int(math.ceil((top - y_min)/headers[4])))
+
+    row_min, row_max = rows if rows is not None else (0, nrows)
+    col_min, col_max = cols if cols is not None else (0, ncols)
+
+    row_min = min(max(int(row_min), 0), nrows)
+    row_max = min(max(int(row_max), row_min), nrows)
+    col_min = min(max(int(col_min), 0), ncols)
+    col_max = min(max(int(col_max), col_min), ncols)
+
+    return row_min, row_max, col_min, col_max
+
+def nodata_to_nan(raster_array, nodata, chunk_rows=1024):
+    """
+    Replace the nodata values of a raster array with NaN, which imshow leaves 
+    blank, in place of np.ma.masked_where. The array is changed in place and 
+    returned, working through blocks of chunk_rows rows so that only a small 
+    boolean array is ever allocated, rather than a full mask and a copy of the 
+    data.
+    
+    Integer arrays, which cannot hold NaN, and read only arrays, such as memory 
+    maps, are first copied to a float32 array.
+    """
+    import numpy as np
+    
+    if raster_array.dtype.kind != 'f':
+        raster_array = raster_array.astype(np.float32)
+    elif not raster_array.flags.writeable:
+        raster_array = np.array(raster_array, dtype=raster_array.dtype.newbyteorder('='))
+
+    for r in range(0, raster_array.shape[0], chunk_rows):
+        block = raster_array[r:r + chunk_rows]
+        block[block == nodata] = np.nan
+    
+    return raster_array
+
+def read_flt_window(input_file, rows=None, cols=None, bbox=None, target_size=None, tiled=False, nan=False):
+    """
+    Read part of a *.flt file, given as row and column bounds or a UTM bounding 
+    box (see window_bounds). Only the pages of the file holding the window are 
+    read, so the cost depends on the size of the window rather than the raster.
+    
+    If target_size is given the window is read from the coarsest overview level
+    (see build_overviews) which still has at least target_size pixels along the 
+    longer side of the window. Use the size of the plotted panel in pixels.
+    
+    If tiled is True the window is assembled from a tiled copy of the raster
+    through a cache of fixed size (see raster_tiles), rather than memory mapping 
+    the whole file.
+    
+    If nan is True nodata values are replaced with NaN in the window as it is 
+    read (see nodata_to_nan), so no masked array is needed to hide them and the
+    nodata value in the returned header is NaN.
+    
+    Returns the window as a 2D numpy array and a header list describing the
+    window, with the dimensions, lower left corner and cellsize updated.
+    """
+    import numpy as np
+    
+    if input_file.endswith('.flt') or input_file.endswith('.hdr'):
+        input_file = input_file[:-4]    
+    else:
+        print('Incorrect filename')
+        return 0,0 #exits module gracefully
+
+    headers = read_headers(input_file)
+    row_min, row_max, col_min, col_max = window_bounds(headers, rows, cols, bbox)
+
+    if target_size is not None:
+        size = max(row_max - row_min, col_max - col_min)
+        factors = [f for f in build_overviews(input_file + '.flt') if size // f >= target_size]
+        if factors:
+            f = max(factors)
+            return read_flt_window('%s.ovr%d.flt' % (input_file, f), (row_min // f, -(-row_max // f)), (col_min // f, -(-col_max // f)), tiled=tiled, nan=nan)
+
+    if tiled:
+        import raster_tiles
+        window = raster_tiles.read_tiled_window(input_file, row_min, row_max, col_min, col_max)
+    else:
+        dtype = raster_dtype(headers)
+        raster_array = read_bin(input_file, (int(headers[1]), int(headers[0])), True, dtype)
+        window = np.array(raster_array[row_min:row_max, col_min:col_max], dtype=dtype.newbyteorder('=')) #copy in native byte order
+    
+    window_headers = list(headers)
+    
+    #the window is a new array, so nodata can be replaced without another copy
+    if nan:
+        window = nodata_to_nan(window, headers[5])
+        window_headers[5] = float('nan')
+
+    window_headers[0] = float(col_max - col_min)
+    window_headers[1] = float(row_max - row_min)
+    window_headers[2] = headers[2] + col_min*headers[4]
+    window_headers[3] = headers[3] + (headers[1] - row_max)*headers[4]
+    
+    return window, window_headers
+
+def header_transform(headers):
+    """
+    Affine transform between the pixel coordinates of a raster, as used to plot
+    it with imshow and to place the UTM ticks, and UTM coordinates, built from 
+    its header list. It is given as the 6 coefficients (x_origin, cellsize, 0, 
+    y_origin, 0, -cellsize), in the order used by GDAL, of
+    
+        x = x_origin + col*cellsize
+        y = y_origin - row*cellsize
+    
+    where the origin is the top left corner of the raster.
+    """
+    return (headers[2], headers[4], 0., headers[3] + headers[1]*headers[4], 0., -headers[4])
+
+def pixel_to_utm(transform, cols, rows):
+    """
+    Convert arrays of pixel coordinates to UTM x and y arrays in one step, using
+    a transform from header_transform.
+    """
+    import numpy as np
+    
+    cols = np.asarray(cols, dtype=np.float64)
+    rows = np.asarray(rows, dtype=np.float64)
+    
+    return (transform[0] + cols*transform[1] + rows*transform[2], 
+            transform[3] + cols*transform[4] + rows*transform[5])
+
+def utm_to_pixel(transform, x, y):
+    """
+    Convert arrays of UTM coordinates, such as the vertices of a shapefile, to 
+    column and row arrays in the pixel coordinates of a raster in one step, using
+    a transform from header_transform.
+    """
+    import numpy as np
+    
+    dx = np.asarray(x, dtype=np.float64) - transform[0]
+    dy = np.asarray(y, dtype=np.float64) - transform[3]
+    det = float(transform[1]*transform[5] - transform[2]*transform[4])
+    
+    return (transform[5]*dx - transform[2]*dy)/det, (transform[1]*dy - transform[4]*dx)/det
+
+def shape_vertices(shapes, separate=True):
+    """
+    The vertices of a list of shapefile shapes as x and y arrays. If separate is
+    True the shapes are split by NaN, so one plot call draws each shape as its 
+    own line.
+    """
+    import numpy as np
+    
+    pieces = []
+    for shape in shapes:
+        pieces.append(np.asarray(shape.points, dtype=np.float64).reshape(-1, 2))
+        if separate:
+            pieces.append(np.full((1, 2), np.nan))
+    if separate and pieces:
+        pieces.pop()
+        
+    vertices = np.concatenate(pieces) if pieces else np.empty((0, 2))
+    
+    return vertices[:, 0], vertices[:, 1]
+
+def header_extent(headers, window_headers):
+    """
+    Extent to pass to imshow to draw a window read by read_flt_window at its 
+    place in the pixel coordinates of the full raster, so that axis limits and 
+    ticks set for the full raster still apply. Takes the header of the full 
+    raster and the header returned with the window, which may be from a coarser 
+    overview level.
+    """
+    scale = window_headers[4] / headers[4]
+    top = headers[3] + headers[1]*headers[4]
+    window_top = window_headers[3] + window_headers[1]*window_headers[4]
+    
+    col_min = (window_headers[2] - headers[2]) / headers[4]
+    row_min = (top - window_top) / headers[4]
+    col_max = col_min + window_headers[0]*scale
+    row_max = row_min + window_headers[1]*scale
+    
+    return (col_min - 0.5, col_max - 0.5, row_max - 0.5, row_min - 0.5)
+
+def prefetch(function, items, ahead=1):
+    """
+    Call function on each of items, yielding the results in order. While each 
+    result is being used, the calls for up to ahead of the following items run 
+    in background threads, so reading the rasters of the next panel of a figure 
+    overlaps with drawing the current one. Reading a raster spends its time in 
+    I/O and numpy, which release the GIL, so threads are enough.
+    """
+    from collections import deque
+    from multiprocessing.pool import ThreadPool
+    
+    pool = ThreadPool(max(ahead, 1))
+    try:
+        pending = deque()
+        for item in items:
+            pending.append(pool.apply_async(function, (item,)))
+            if len(pending) > ahead:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def can_fork():
+    """
+    Worker processes are only used where they can be forked. Spawned workers
+    re-run the calling script, which the figure scripts do not guard against.
+    """
+    import sys
+    import multiprocessing
+
+    try:
+        return multiprocessing.get_start_method() == 'fork'
+    except AttributeError:
+        return sys.platform != 'win32'
+
+def composite_rgba(hillshade, overlay, cmap, vmin=None, vmax=None, alpha=1., hillshade_limits=(0., 255.)):
+    """
+    Blend a hillshade, drawn in gray between hillshade_limits, and an overlay of
+    the same shape coloured by cmap between vmin and vmax, into one uint8 RGBA 
+    array for a single imshow call. This gives the same image as drawing the 
+    overlay with the given alpha in a second imshow over the hillshade.
+    
+    NaN cells of either array are not drawn, and vmin and vmax default to the 
+    range of the overlay as in imshow. cmap is a matplotlib colormap or its name.
+    """
+    import numpy as np
+
+    if hillshade.shape != overlay.shape:
+        raise ValueError('hillshade and overlay must be the same shape')
+
+    if not callable(cmap):
+        try:
+            from matplotlib import colormaps
+            cmap = colormaps[cmap]
+        except ImportError:
+            import matplotlib.cm as cmx
+            cmap = cmx.get_cmap(cmap)
+    lut = np.asarray(cmap(np.linspace(0, 1, 256)))[:, :3]*255
+
+    shade_valid = ~np.isnan(hillshade)
+    overlay_valid = ~np.isnan(overlay)
+
+    if vmin is None:
+        vmin = np.nanmin(overlay) if overlay_valid.any() else 0.
+    if vmax is None:
+        vmax = np.nanmax(overlay) if overlay_valid.any() else 1.
+
+    lo, hi = hillshade_limits
+    gray = np.clip((np.where(shade_valid, hillshade, lo) - lo) / float(hi - lo), 0, 1)[..., np.newaxis]*255
+
+    #index the colormap as matplotlib does, values outside vmin and vmax take the end colours
+    scaled = (np.where(overlay_valid, overlay, vmin) - vmin) / float(vmax - vmin or 1)
+    colour = lut[np.clip(np.floor(scaled*256), 0, 255).astype(np.intp)]
+
+    #where there is no hillshade the overlay is drawn over nothing
+    over_shade = (overlay_valid & shade_valid)[..., np.newaxis]
+    rgb = np.where(over_shade, alpha*colour + (1 - alpha)*gray, np.where(overlay_valid[..., np.newaxis], colour, gray))
+
+    rgba = np.empty(hillshade.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.round(rgb)
+    rgba[..., 3] = np.where(shade_valid, 255, np.where(overlay_valid, int(alpha*255 + 0.5), 0))
+
+    return rgba
+
+def masked_range(input_file, mask_file, block_rows=1024):
+    """
+    The minimum and maximum of the valid cells of a *.flt file which are also 
+    valid in a mask *.flt file of the same shape, or (None, None) if there are 
+    none. The rasters are read from memory maps block_rows rows at a time.
+    """
+    import numpy as np
+
+    headers = read_headers(input_file[:-4])
+    mask_headers = read_headers(mask_file[:-4])
+    shape = (int(headers[1]), int(headers[0]))
+    if (int(mask_headers[1]), int(mask_headers[0])) != shape:
+        raise ValueError(mask_file + ' is not the same shape as ' + input_file)
+
+    raster_array = read_bin(input_file[:-4], shape, True, raster_dtype(headers))
+    mask_array = read_bin(mask_file[:-4], shape, True, raster_dtype(mask_headers))
+
+    low, high = None, None
+    for start in range(0, shape[0], block_rows):
+        block = np.asarray(raster_array[start:start + block_rows], dtype=np.float64)
+        mask = np.asarray(mask_array[start:start + block_rows], dtype=np.float64)
+        values = block[(block != headers[5]) & ~np.isnan(block) & (mask != mask_headers[5]) & ~np.isnan(mask)]
+        if values.size:
+            low = values.min() if low is None else min(low, values.min())
+            high = values.max() if high is None else max(high, values.max())
+
+    return low, high
+
+def read_composite(hillshade_file, mask_file, rows=None, cols=None, target_size=None, cmap='Reds', 
+                   vmin=None, vmax=None, alpha=1., shade_mask=False):
+    """
+    Read the same window of a hillshade and a mask *.flt file (see 
+    read_flt_window) and blend them into one RGBA image with composite_rgba, the
+    mask coloured by cmap between vmin and vmax with the given alpha. If 
+    shade_mask is True the hillshade is coloured inside the mask instead of the
+    mask values, and vmin and vmax default to its range inside the whole mask
+    (see masked_range) rather than inside the window.
+    
+    The image is cached next to the hillshade as <name>.rgba_<mask>_<key>.npz,
+    keyed by the mask and every argument, and is reused until either raster 
+    changes. Only the latest image of each hillshade and mask is kept, so
+    images drawn with other windows or colours are deleted when it is written.
+    
+    Returns the RGBA array and the header of the window, for header_extent.
+    """
+    import os
+    import json
+    import hashlib
+    import numpy as np
+
+    name = cmap if isinstance(cmap, str) else cmap.name
+    headers = read_headers(hillshade_file[:-4])
+    window = window_bounds(headers, rows, cols)
+    key = repr((os.path.abspath(mask_file), window, target_size, name, vmin, vmax, alpha, shade_mask))
+    prefix = '%s.rgba_%s_' % (hillshade_file[:-4], hashlib.sha1(os.path.abspath(mask_file).encode('utf-8')).hexdigest()[:8])
+    cache = prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()[:12] + '.npz'
+
+    modified = max(os.path.getmtime(hillshade_file), os.path.getmtime(mask_file))
+    if os.path.exists(cache) and os.path.getmtime(cache) >= modified:
+        with np.load(cache) as cached:
+            return cached['rgba'], json.loads(cached['header'].item())
+
+    hillshade, window_header = read_flt_window(hillshade_file, window[:2], window[2:], target_size=target_size, nan=True)
+    mask, _ = read_flt_window(mask_file, window[:2], window[2:], target_size=target_size, nan=True)
+
+    if shade_mask:
+        mask[~np.isnan(mask)] = hillshade[~np.isnan(mask)]
+        if vmin is None or vmax is None:
+            low, high = masked_range(hillshade_file, mask_file)
+            vmin = low if vmin is None else vmin
+            vmax = high if vmax is None else vmax
+
+    rgba = composite_rgba(hillshade, mask, cmap, vmin, vmax, alpha)
+
+    with open(cache + '.part', 'wb') as f:
+        np.savez(f, rgba=rgba, header=np.array(json.dumps(window_header)))
+    if os.path.exists(cache):
+        os.remove(cache)
+    os.rename(cache + '.part', cache)
+
+    #images of this hillshade and mask drawn with other arguments are superseded
+    directory, start = os.path.split(prefix)
+    for old in os.listdir(directory or '.'):
+        if old.startswith(start) and old.endswith('.npz') and old != os.path.basename(cache):
+            os.remove(os.path.join(directory, old))
+
+    return rgba, window_header
+
+#overview levels are built until the longer side of the raster is smaller than this
+OVERVIEW_MIN_SIZE = 256
+
+def downsample_raster(input_file, output_file, method=None, chunk_rows=2048):
+    """
+    Write a copy of input_file.flt at half the resolution to output_file.flt and
+    output_file.hdr. With method 'mean' each cell is the mean of the 2x2 cells
+    it covers, ignoring nodata, with 'nearest' it is the top left of them. By 
+    default floating point rasters are averaged and integer rasters, such as 
+    masks, are decimated so they keep their values. The raster is processed 
+    chunk_rows rows at a time so memory use does not depend on its size.
+    """
+    import numpy as np
+    
+    headers = read_headers(input_file)
+    dtype = raster_dtype(headers)
+    ncols, nrows, nodata = int(headers[0]), int(headers[1]), headers[5]
+    if method is None:
+        method = 'mean' if dtype.kind == 'f' else 'nearest'
+    
+    raster_array = read_bin(input_file, (nrows, ncols), True, dtype)
+    out_cols = -(-ncols // 2)
+
+    def downsampled_chunks(chunk_rows):
+        for start in range(0, nrows, chunk_rows):
+            chunk = raster_array[start:start + chunk_rows]
+            if method == 'nearest':
+                yield chunk[::2, ::2]
+            else:
+                #pad to an even size with nodata, then average the valid cells of each 2x2 block
+                padded = np.full((-(-len(chunk) // 2) * 2, out_cols * 2), nodata)
+                padded[:len(chunk), :ncols] = chunk
+                valid = padded != nodata
+                blocks = np.where(valid, padded, 0).reshape(len(padded) // 2, 2, out_cols, 2)
+                counts = valid.reshape(blocks.shape).sum(axis=(1, 3))
+                yield np.where(counts > 0, blocks.sum(axis=(1, 3)) / np.maximum(counts, 1), nodata)
+
+    out_headers = list(headers)
+    out_headers[0] = float(out_cols)
+    out_headers[1] = float(-(-nrows // 2))
+    out_headers[4] = headers[4]*2
+    out_headers[3] = headers[3] + (nrows - out_headers[1]*2)*headers[4] #keep the top edge in place
+    write_flt(output_file, downsampled_chunks(chunk_rows + chunk_rows % 2), out_headers)
+
+def build_overviews(input_file, method=None):
+    """
+    Build overview levels of a *.flt file, each half the resolution of the last, 
+    until the raster is smaller than OVERVIEW_MIN_SIZE. Level f is cached next to
+    the raster as <name>.ovr<f>.flt and .hdr, and is only rebuilt if the raster 
+    has been changed since it was built. See downsample_raster for method.
+    
+    Returns the list of available reduction factors, eg [2, 4, 8].
+    """
+    import os
+    
+    if input_file.endswith('.flt') or input_file.endswith('.hdr'):
+        input_file = input_file[:-4]    
+    
+    headers = read_headers(input_file)
+    size = max(headers[0], headers[1])
+    modified = os.path.getmtime(input_file + '.flt')
+
+    factors = []
+    source = input_file
+    factor = 2
+    while size / factor >= OVERVIEW_MIN_SIZE:
+        output = '%s.ovr%d' % (input_file, factor)
+        if not os.path.exists(output + '.hdr') or os.path.getmtime(output + '.hdr') < modified:
+            downsample_raster(source, output, method)
+        factors.append(factor)
+        source = output
+        factor *= 2
+
+    return factors
+
+def write_headers(output_file, headers):
+    """
+    Write a header list, in the format returned by read_headers, to output_file.hdr
+    """
+    keys = ['ncols', 'nrows', 'xllcorner', 'yllcorner', 'cellsize', 'NODATA_value', 'byteorder', 'datatype']
+
+    with open(output_file + '.hdr', 'w') as f:
+        for key, value in zip(keys, headers):
+            if isinstance(value, float):
+                value = int(value) if value.is_integer() else repr(value) #repr keeps every digit
+            f.write('%s %s\n' % (key, value))
+
+def write_flt(output_file, data, headers, chunk_rows=1024):
+    """
+    Write a raster to output_file.flt and output_file.hdr, given the header list
+    in the format returned by read_headers. The values are written in the byte 
+    order and data type the header describes (see raster_dtype).
+    
+    data is either a 2D array, such as a memory map or a window read by 
+    read_flt_window, which is written chunk_rows rows at a time, or an iterable,
+    such as a generator, of 2D blocks of rows which are written as they are 
+    produced. Derived rasters can then be saved without ever holding all of 
+    them in memory.
+    
+    The *.hdr file is written last, so a failed write does not leave a readable
+    raster behind. Returns the name of the *.flt file.
+    """
+    import os
+    import numpy as np
+
+    if output_file.endswith('.flt') or output_file.endswith('.hdr'):
+        output_file = output_file[:-4]
+
+    dtype = raster_dtype(headers)
+    ncols, nrows = int(headers[0]), int(headers[1])
+
+    if hasattr(data, 'shape'):
+        blocks = (data[start:start + chunk_rows] for start in range(0, len(data), chunk_rows))
+    else:
+        blocks = data
+
+    if os.path.exists(output_file + '.hdr'):
+        os.remove(output_file + '.hdr')
+
+    rows = 0
+    with open(output_file + '.flt', 'wb') as out:
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=dtype)
+            if block.ndim != 2 or block.shape[1] != ncols:
+                raise ValueError('blocks written to ' + output_file + '.flt must have ' + str(ncols) + ' columns')
+            block.tofile(out)
+            rows += len(block)
+
+    if rows != nrows:
+        raise ValueError(output_file + '.flt has ' + str(rows) + ' rows, expected ' + str(nrows))
+
+    write_headers(output_file, headers)
+
+    return output_file + '.flt'
+
+#number of evenly spaced quantiles kept to estimate percentiles of a raster
+STATS_QUANTILES = 1001
+
+def block_statistics(args):
+    """
+    Statistics of the valid cells in rows row_min:row_max of a *.flt file, 
+    returned as (count, min, max, sum, sum of squares, quantiles), or None if 
+    there are no valid cells. Used by raster_statistics.
+    """
+    import numpy as np
+
+    input_file, row_min, row_max = args
+    headers = read_headers(input_file)
+    raster_array = read_bin(input_file, (int(headers[1]), int(headers[0])), True, raster_dtype(headers))
+
+    block = np.asarray(raster_array[row_min:row_max], dtype=np.float64).ravel()
+    block = block[(block != headers[5]) & ~np.isnan(block)]
+    if not block.size:
+        return None
+
+    #the quantiles at the middle of equal shares of the cells, so each one stands for the same number of cells
+    quantiles = np.percentile(block, (np.arange(STATS_QUANTILES) + 0.5) * 100. / STATS_QUANTILES)
+    return block.size, block.min(), block.max(), block.sum(), np.dot(block, block), quantiles
+
+def raster_statistics(input_file, block_rows=1024, processes=None):
+    """
+    Statistics of the valid cells of a *.flt file, ignoring nodata and NaN, as a
+    dict of count, min, max, mean, std and quantiles, a list of STATS_QUANTILES 
+    evenly spaced quantiles for raster_percentile.
+    
+    The raster is read in one pass of blocks of block_rows rows from a memory 
+    map, across a pool of forked worker processes where possible, so memory use
+    does not depend on its size. min, max, mean and std are exact, percentiles 
+    are estimated from the quantiles of every block, to within about 0.1% of 
+    the cells.
+    
+    The result is cached next to the raster as <name>.stats and is reused until
+    the raster is changed.
+    """
+    import os
+    import json
+    import multiprocessing
+    import numpy as np
+
+    if input_file.endswith('.flt') or input_file.endswith('.hdr'):
+        input_file = input_file[:-4]
+
+    cache = input_file + '.stats'
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(input_file + '.flt'):
+        with open(cache, 'r') as f:
+            return json.load(f)
+
+    nrows = int(read_headers(input_file)[1])
+    tasks = [(input_file, r, min(r + block_rows, nrows)) for r in range(0, nrows, block_rows)]
+
+    processes = min(processes or multiprocessing.cpu_count(), len(tasks))
+    if can_fork() and processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            blocks = pool.map(block_statistics, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        blocks = [block_statistics(task) for task in tasks]
+    blocks = [b for b in blocks if b is not None]
+
+    if not blocks:
+        stats = {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None, 'quantiles': []}
+    else:
+        counts = np.array([b[0] for b in blocks], dtype=np.float64)
+        count = counts.sum()
+        mean = sum(b[3] for b in blocks) / count
+        variance = max(sum(b[4] for b in blocks) / count - mean**2, 0.)
+
+        #merge the block quantiles, each standing for an equal share of its block's cells
+        values = np.concatenate([b[5] for b in blocks])
+        weights = np.repeat(counts / STATS_QUANTILES, STATS_QUANTILES)
+        order = np.argsort(values, kind='mergesort')
+        values, weights = values[order], weights[order]
+        ranks = (np.cumsum(weights) - weights/2.) / count
+        
+        #the exact min and max are the ends of the distribution
+        ranks = np.concatenate([[0.], ranks, [1.]])
+        values = np.concatenate([[min(b[1] for b in blocks)], values, [max(b[2] for b in blocks)]])
+        quantiles = np.interp(np.linspace(0, 1, STATS_QUANTILES), ranks, values)
+
+        stats = {'count': int(count), 'min': float(values[0]), 'max': float(values[-1]), 'mean': float(mean),
+                 'std': float(np.sqrt(variance)), 'quantiles': [float(q) for q in quantiles]}
+
+    with open(cache + '.part', 'w') as f:
+        json.dump(stats, f)
+    if os.path.exists(cache):
+        os.remove(cache)
+    os.rename(cache + '.part', cache)
+
+    return stats
+
+def raster_percentile(stats, q):
+    """
+    Estimate the q-th percentile, 0 to 100, of a raster from the statistics 
+    returned by raster_statistics. q can be a number or a sequence.
+    """
+    import numpy as np
+
+    return np.interp(q, np.linspace(0, 100, len(stats['quantiles'])), stats['quantiles'])
+
+def color_limits(input_file, low=2., high=98.):
+    """
+    Colour limits (vmin, vmax) for plotting a *.flt file, the low and high 
+    percentiles of its valid cells, from its cached statistics.
+    """
+    stats = raster_statistics(input_file)
+    vmin, vmax = raster_percentile(stats, [low, high])
+    return float(vmin), float(vmax)
+
+def read_ascii_headers(f):
+    """
+    Read the header lines of an open *.asc file, leaving the file at the start of
+    the data. Returns the header as a list of [ncols, nrows, xllcorner, yllcorner,
+    cellsize, NODATA_value], with cell center coordinates converted to corners.
+    """
+    header = {}
+    while True:
+        position = f.tell()
+        line = f.readline().split()
+        if not line or not line[0][:1].isalpha():
+            f.seek(position)
+            break
+        header[line[0].decode('ascii').lower()] = float(line[1])
+
+    cellsize = header['cellsize']
+    xll = header['xllcorner'] if 'xllcorner' in header else header['xllcenter'] - cellsize/2.
+    yll = header['yllcorner'] if 'yllcorner' in header else header['yllcenter'] - cellsize/2.
+
+    return [header['ncols'], header['nrows'], xll, yll, cellsize, header.get('nodata_value', -9999.)]
+
+def iter_ascii_blocks(f, block_size):
+    """
+    Read the data of an open *.asc file in blocks of roughly block_size bytes, 
+    which always end between two values.
+    """
+    remainder = b''
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        block = remainder + block
+        end = max(block.rfind(b'\n'), block.rfind(b' ')) + 1
+        remainder = block[end:]
+        if end:
+            yield block[:end]
+    if remainder:
+        yield remainder
+
+def parse_ascii_block(block, dtype='<f8'):
+    """
+    Parse a block of whitespace separated values from an *.asc file into an array
+    of dtype, by default little endian float64, in the format of a *.flt file.
+    """
+    import numpy as np
+
+    return np.fromstring(block, dtype=dtype, sep=' ')
+
+def convert_ascii_raster(ascii_raster_file, output_file, block_size=8*1024*1024, processes=None, dtype='<f8'):
+    """
+    Convert a *.asc file into output_file.flt and output_file.hdr. The text is 
+    parsed in blocks of rows by a pool of worker processes and the floats are 
+    streamed to the *.flt file, so memory use depends on the block size rather 
+    than the size of the raster. The *.hdr file is written last, so a failed 
+    conversion does not leave a readable raster behind.
+    
+    The values are stored as dtype, a numpy float type. The default of float64
+    keeps them exactly as parsed, '<f4' halves the size of the file.
+    """
+    import os
+    import multiprocessing
+    import numpy as np
+    from collections import deque
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if can_fork() and processes > 1 else None
+
+    if os.path.exists(output_file + '.hdr'):
+        os.remove(output_file + '.hdr')
+
+    n_values = 0
+    try:
+        with open(ascii_raster_file, 'rb') as f, open(output_file + '.flt', 'wb') as out:
+            headers = read_ascii_headers(f)
+            pending = deque()
+            for block in iter_ascii_blocks(f, block_size):
+                if pool is None:
+                    pending.append(parse_ascii_block(block, dtype))
+                else:
+                    pending.append(pool.apply_async(parse_ascii_block, (block, dtype)))
+                while pending and (pool is None or len(pending) > processes):
+                    values = pending.popleft()
+                    values = values if pool is None else values.get()
+                    values.tofile(out)
+                    n_values += len(values)
+            while pending:
+                values = pending.popleft().get()
+                values.tofile(out)
+                n_values += len(values)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if n_values != int(headers[0])*int(headers[1]):
+        raise ValueError(ascii_raster_file + ' holds ' + str(n_values) + ' values, expected ncols*nrows')
+
+    write_headers(output_file, headers + ['LSBFIRST', np.dtype(dtype).name])
+
+def read_ascii_raster(ascii_raster_file, mmap=False):
     """
     Wrapper method to read the header and data of a *.asc file. Pass in a filename
     amd it returns the data as a 2D numpy array and the header data as a list.
+    
+    The first time a file is read it is converted to a binary raster cached next 
+    to it (eg dem.asc.flt and dem.asc.hdr for dem.asc). Later reads load the cached 
+    binary until the *.asc file is changed. The cache holds float64 values, so the
+    data is exactly as parsed from the text, returned as a float64 array or with
+    mmap set to True as a read only memory map of the cached file.
     """
+    import os
     import numpy as np
     
-    with open(ascii_raster_file) as f:
-        header_data = [float(f.next().split()[1]) for x in xrange(6)] #read the first 6 lines
-         
-    raster_data = np.genfromtxt(ascii_raster_file, delimiter=' ', skip_header=6)
-    raster_data = raster_data.reshape(header_data[1], header_data[0]) #rows, columns
+    cached = ascii_raster_file + '.hdr'
+    if (not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(ascii_raster_file)
+            or raster_dtype(read_headers(ascii_raster_file)) != np.float64):
+        convert_ascii_raster(ascii_raster_file, ascii_raster_file)
     
-    return raster_data, header_data
+    return read_flt(ascii_raster_file + '.flt', mmap)
 
-def format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics):
+#tick locations and labels already computed, keyed by header, extent, tick count and window
+UTM_TICKS = {}
+
+def format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,window=None):
     """
     Method to create correctly formatted UTM ticks for plotting the raster files.
     Pass in the header list, x and y dimensions and the number of ticks required
-    for each axis.
+    for each axis. Any number of ticks can be asked for.
+    
+    The tick spacing is the larger of the x and y extents divided by 
+    n_target_tics, rounded down to its first significant figure. Ticks are placed
+    from the lower left of the extent, rounded down to the same power of ten.
+    
+    window is the visible part of the plot in pixels, as (x_min, x_max, y_min, 
+    y_max) in the order passed to xlim and ylim, and defaults to the extent. Only
+    ticks inside it are returned, so matplotlib does not lay out labels which 
+    would be clipped. Results are memoized.
     
     Returns the locations and labels of the new ticks which can be fed into matplotlib.
     
     SMM
     """
-    import numpy as np    
-   
-    xmax_UTM = hillshade_header[2]+x_max*hillshade_header[4]
-    xmin_UTM = hillshade_header[2]+x_min*hillshade_header[4]
-      
-    # need to be careful with the ymax_UTM since the rows go from the top
-    # but the header index is to bottom corner    
-    
-    #convert coordinates to UTM
-    ymax_from_bottom = hillshade_header[1]-y_min
-    ymin_from_bottom = hillshade_header[1]-y_max
-    ymax_UTM = hillshade_header[3]+ymax_from_bottom*hillshade_header[4]
-    ymin_UTM = hillshade_header[3]+ymin_from_bottom*hillshade_header[4]
+    import math
+    import numpy as np
+    
+    if window is None:
+        window = (x_min, x_max, y_min, y_max)
         
-    dy_fig = ymax_UTM-ymin_UTM
-    dx_fig = xmax_UTM-xmin_UTM
+    key = (tuple(hillshade_header[:5]), x_max, x_min, y_max, y_min, n_target_tics, tuple(window))
+    if key in UTM_TICKS:
+        return UTM_TICKS[key]
     
-    dx_spacing = dx_fig/n_target_tics
-    dy_spacing = dy_fig/n_target_tics
+    xll, yll, cellsize = hillshade_header[2], hillshade_header[3], hillshade_header[4]
+    top = yll + hillshade_header[1]*cellsize #UTM y of row 0, as rows go from the top
+   
+    #convert the extent to UTM
+    xmin_UTM = xll + x_min*cellsize
+    ymin_UTM = top - y_max*cellsize
     
-    if (dx_spacing>dy_spacing):
-        dy_spacing = dx_spacing
+    spacing = max(x_max - x_min, y_max - y_min)*cellsize/float(n_target_tics)
+    magnitude = 10**math.floor(math.log10(spacing))
+    spacing = math.floor(spacing/magnitude)*magnitude
     
-    str_dy = str(dy_spacing)
-    str_dy = str_dy.split('.')[0]
-    n_digits = str_dy.__len__()
-    nd = int(n_digits)
-        
-    first_digit = float(str_dy[0])
-    
-    dy_spacing_rounded = first_digit*pow(10,(nd-1))
- 
-    str_xmin = str(xmin_UTM)
-    str_ymin = str(ymin_UTM)
-    str_xmin = str_xmin.split('.')[0]
-    str_ymin = str_ymin.split('.')[0]
-    xmin_UTM = float(str_xmin)
-    ymin_UTM = float(str_ymin)
-    
-    n_digx = str_xmin.__len__() 
-    n_digy = str_ymin.__len__() 
-    
-    front_x = str_xmin[:(n_digx-nd+1)]
-    front_y = str_ymin[:(n_digy-nd+1)]
-           
-    round_xmin = float(front_x)*pow(10,nd-1)
-    round_ymin = float(front_y)*pow(10,nd-1)
-        
-    # now we need to figure out where the xllocs and ylocs are
-    xUTMlocs = np.zeros(2*n_target_tics)
-    yUTMlocs = np.zeros(2*n_target_tics)
-    xlocs = np.zeros(2*n_target_tics)
-    ylocs = np.zeros(2*n_target_tics)
-    
-    new_x_labels = []
-    new_y_labels = []
-    
-    for i in range(0,2*n_target_tics):
-        xUTMlocs[i] = round_xmin+(i)*dy_spacing_rounded
-        yUTMlocs[i] = round_ymin+(i)*dy_spacing_rounded
-                  
-        xlocs[i] = (xUTMlocs[i]-hillshade_header[2])/hillshade_header[4]
-        
-        # need to account for the rows starting at the upper boundary
-        ylocs[i] = hillshade_header[1]-((yUTMlocs[i]-hillshade_header[3])/hillshade_header[4])
-        
-        new_x_labels.append( str(xUTMlocs[i]).split(".")[0] )
-        new_y_labels.append( str(yUTMlocs[i]).split(".")[0] )
+    #the ticks lie on a grid starting from the lower left corner, rounded down to the magnitude of the spacing
+    x_origin = math.floor(xmin_UTM/magnitude)*magnitude
+    y_origin = math.floor(ymin_UTM/magnitude)*magnitude
+    
+    def axis_ticks(origin, lo, hi):
+        first = math.ceil((lo - origin)/spacing - 1e-9)
+        last = math.floor((hi - origin)/spacing + 1e-9)
+        return origin + spacing*np.arange(first, last + 1)
+    
+    #only ticks inside the visible window
+    xUTMlocs = axis_ticks(x_origin, xll + min(window[:2])*cellsize, xll + max(window[:2])*cellsize)
+    yUTMlocs = axis_ticks(y_origin, top - max(window[2:])*cellsize, top - min(window[2:])*cellsize)
+    
+    xlocs = (xUTMlocs - xll)/cellsize
+    ylocs = (top - yUTMlocs)/cellsize #rows start at the upper boundary
+    
+    new_x_labels = ['%d' % x for x in xUTMlocs]
+    new_y_labels = ['%d' % y for y in yUTMlocs]
    
+    UTM_TICKS[key] = xlocs,ylocs,new_x_labels,new_y_labels
     return xlocs,ylocs,new_x_labels,new_y_labels
\ No newline at end of file
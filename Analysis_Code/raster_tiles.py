@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2015 Stuart W.D Grieve 2015
+
+Developer can be contacted by s.grieve _at_ ed.ac.uk
+
+This program is free software;
+you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation;
+either version 2 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY;
+without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the
+GNU General Public License along with this program;
+if not, write to:
+Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301
+USA
+
+Tiled storage for *.flt rasters which are larger than memory, used by
+raster_plotter_simple.read_flt_window(..., tiled=True).
+
+A raster is copied once into a <name>.tiles file next to it, which holds the
+raster as square tiles of TILE_SIZE cells, optionally zlib compressed, with a
+table of the byte offset of every tile. Windows are assembled from just the
+tiles they overlap.
+
+Tiles which have been read are kept in a least recently used cache which is
+shared by every tiled raster and never holds more than TILE_CACHE_BYTES, so
+plotting many large rasters stays within a fixed amount of memory.
+
+@author: SWDG
+"""
+
+import os
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+
+#number of cells along each side of a tile
+TILE_SIZE = 512
+
+#largest number of bytes of decompressed tiles held in memory at once
+TILE_CACHE_BYTES = 256*1024*1024
+
+#identifies a tiles file, followed by nrows, ncols, tile size, dtype and compression flag
+TILES_MAGIC = b'FLTTILE1'
+TILES_HEADER = struct.Struct('<8sqqq4s?')
+
+#decompressed tiles keyed by (tiles file, modification time, tile row, tile col), least recently used first
+TILE_CACHE = OrderedDict()
+CACHE_STATE = {'bytes': 0}
+CACHE_LOCK = threading.Lock()
+
+#header and offset table of each tiles file, keyed by path and modification time
+TILE_INDEX = {}
+
+
+def tiles_file(input_file):
+    """
+    Path of the tiled copy of a raster, given its name without extension.
+    """
+    return input_file + '.tiles'
+
+
+def build_tiles(input_file, tile_size=TILE_SIZE, compress=False):
+    """
+    Copy input_file.flt into a tiles file of square tiles of tile_size cells,
+    zlib compressing each tile if compress is True. The raster is read through
+    a memory map one band of tiles at a time, so this works for rasters larger
+    than memory. The tiles file is only rebuilt if the raster has changed since
+    it was written.
+    """
+    import raster_plotter_simple as raster
+
+    output = tiles_file(input_file)
+    if os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(input_file + '.flt'):
+        return output
+
+    headers = raster.read_headers(input_file)
+    dtype = raster.raster_dtype(headers)
+    nrows, ncols = int(headers[1]), int(headers[0])
+    raster_array = raster.read_bin(input_file, (nrows, ncols), True, dtype)
+
+    tile_rows = -(-nrows // tile_size)
+    tile_cols = -(-ncols // tile_size)
+    offsets = np.zeros(tile_rows*tile_cols + 1, dtype='<i8')
+    start = TILES_HEADER.size + offsets.nbytes
+
+    #write to a temporary name so an interrupted build is never read
+    with open(output + '.part', 'wb') as f:
+        f.write(TILES_HEADER.pack(TILES_MAGIC, nrows, ncols, tile_size, dtype.str.encode('ascii'), compress))
+        f.write(offsets.tobytes())
+        for r in range(tile_rows):
+            band = np.array(raster_array[r*tile_size:(r + 1)*tile_size])
+            for c in range(tile_cols):
+                data = np.ascontiguousarray(band[:, c*tile_size:(c + 1)*tile_size]).tobytes()
+                if compress:
+                    data = zlib.compress(data, 1)
+                f.write(data)
+                offsets[r*tile_cols + c + 1] = offsets[r*tile_cols + c] + len(data)
+        f.seek(TILES_HEADER.size)
+        f.write((offsets + start).astype('<i8').tobytes())
+
+    if os.path.exists(output):
+        os.remove(output)
+    os.rename(output + '.part', output)
+
+    #release the tiles of the old file
+    with CACHE_LOCK:
+        for key in [key for key in TILE_CACHE if key[0] == output]:
+            CACHE_STATE['bytes'] -= TILE_CACHE.pop(key).nbytes
+
+    return output
+
+
+def tile_index(path):
+    """
+    Read the header and offset table of a tiles file, returning a tuple of
+    (nrows, ncols, tile_size, dtype, compressed, offsets). Memoized until the
+    file is modified.
+    """
+    key = (path, os.path.getmtime(path))
+    if key not in TILE_INDEX:
+        with open(path, 'rb') as f:
+            magic, nrows, ncols, tile_size, dtype, compressed = TILES_HEADER.unpack(f.read(TILES_HEADER.size))
+            if magic != TILES_MAGIC:
+                raise IOError(path + ' is not a tiles file')
+            n_tiles = (-(-nrows // tile_size))*(-(-ncols // tile_size))
+            offsets = np.frombuffer(f.read(8*(n_tiles + 1)), dtype='<i8')
+        TILE_INDEX[key] = (nrows, ncols, tile_size, np.dtype(dtype.rstrip(b'\x00').decode('ascii')), compressed, offsets)
+    return TILE_INDEX[key]
+
+
+def read_tile(path, tile_row, tile_col):
+    """
+    Read one tile of a tiles file as a read only 2D array, through the least
+    recently used tile cache. Tiles are cached against the modification time of
+    the tiles file, so tiles of a rebuilt file are never served from the cache.
+    """
+    key = (path, os.path.getmtime(path), tile_row, tile_col)
+    with CACHE_LOCK:
+        if key in TILE_CACHE:
+            tile = TILE_CACHE.pop(key)
+            TILE_CACHE[key] = tile
+            return tile
+
+    nrows, ncols, tile_size, dtype, compressed, offsets = tile_index(path)
+    tile_cols = -(-ncols // tile_size)
+    i = tile_row*tile_cols + tile_col
+
+    with open(path, 'rb') as f:
+        f.seek(offsets[i])
+        data = f.read(offsets[i + 1] - offsets[i])
+    if compressed:
+        data = zlib.decompress(data)
+
+    height = min(tile_size, nrows - tile_row*tile_size)
+    width = min(tile_size, ncols - tile_col*tile_size)
+    tile = np.frombuffer(data, dtype=dtype).reshape(height, width)
+
+    with CACHE_LOCK:
+        #another thread may have read the same tile meanwhile, keep its copy so it is only counted once
+        if key in TILE_CACHE:
+            tile = TILE_CACHE.pop(key)
+            TILE_CACHE[key] = tile
+            return tile
+        TILE_CACHE[key] = tile
+        CACHE_STATE['bytes'] += tile.nbytes
+        while CACHE_STATE['bytes'] > TILE_CACHE_BYTES and len(TILE_CACHE) > 1:
+            _, old = TILE_CACHE.popitem(last=False)
+            CACHE_STATE['bytes'] -= old.nbytes
+
+    return tile
+
+
+def clear_tile_cache():
+    """
+    Empty the tile cache, releasing its memory.
+    """
+    with CACHE_LOCK:
+        TILE_CACHE.clear()
+        CACHE_STATE['bytes'] = 0
+
+
+def read_tiled_window(input_file, row_min, row_max, col_min, col_max):
+    """
+    Assemble the window row_min:row_max, col_min:col_max of a raster, given its
+    name without extension, from the tiles it overlaps. The tiles file is built
+    first if needed. Returns a 2D array in native byte order.
+    """
+    path = build_tiles(input_file)
+    nrows, ncols, tile_size, dtype, compressed, offsets = tile_index(path)
+
+    window = np.empty((row_max - row_min, col_max - col_min), dtype=dtype.newbyteorder('='))
+
+    for tile_row in range(row_min // tile_size, -(-row_max // tile_size)):
+        for tile_col in range(col_min // tile_size, -(-col_max // tile_size)):
+            tile = read_tile(path, tile_row, tile_col)
+            top = tile_row*tile_size
+            left = tile_col*tile_size
+            r0, r1 = max(row_min, top), min(row_max, top + tile.shape[0])
+            c0, c1 = max(col_min, left), min(col_max, left + tile.shape[1])
+            window[r0 - row_min:r1 - row_min, c0 - col_min:c1 - col_min] = tile[r0 - top:r1 - top, c0 - left:c1 - left]
+
+    return window
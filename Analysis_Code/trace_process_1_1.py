@@ -39,6 +39,7 @@ USA
 import shapefile as shp
 import os
 import platform
+import lh_data_loader as lhd
 
 #test for environment
 if platform.system() is 'Windows':        
@@ -52,7 +53,7 @@ else: #assume unix
 filenames = []
 
 for t in os.listdir(path):
-    if t.endswith('.txt'):
+    if t.endswith(('.txt', '.txt.gz', '.txt.bz2', '.txt.xz')): #trace files may be compressed
         filenames.append(t)
 
 files = []
@@ -81,7 +82,7 @@ for filename in files:
     
     count = count + 1    
     
-    with open(path+filename, 'r') as f:
+    with lhd.open_data(path+filename) as f:
         data = f.readlines()
     
     x = []
@@ -50,7 +50,6 @@ To Do:
     expose hillshdae size padding (currently 2000)
     expose image trim param
     remove needless rcparams
-    figure out how to plot axis ticks with >4 locations
     modify code to cope with 1 -> 8 study areas [memory issues?]
     include code to have odd numbers of study sites
     
@@ -69,6 +68,7 @@ def Draw_Outline(Country_Outline,State_Borders,Points):
     import matplotlib.pyplot as plt
     from matplotlib import rcParams
     import shapefile as shp
+    import raster_plotter_simple as raster
         
     # Set up fonts for plots
     rcParams['font.family'] = 'sans-serif'
@@ -85,33 +85,18 @@ def Draw_Outline(Country_Outline,State_Borders,Points):
     #http://eric.clst.org/Stuff/USGeoJSON
     sf = shp.Reader(Country_Outline)
     
-    for shape in sf.shapes():
-        x=[]
-        y=[]
-        for point in shape.points:
-            x.append(point[0])
-            y.append(point[1])
-        plt.plot(x,y,'k-',linewidth=0.5,alpha=0.25)
+    x, y = raster.shape_vertices(sf.shapes())
+    plt.plot(x,y,'k-',linewidth=0.5,alpha=0.25)
     
     sf = shp.Reader(State_Borders)#"polygon_project.shp"
     
-    for shape in sf.shapes():
-        x=[]
-        y=[]
-        for point in shape.points:
-            x.append(point[0])
-            y.append(point[1])
-        plt.plot(x,y,'k-',linewidth=1)
+    x, y = raster.shape_vertices(sf.shapes())
+    plt.plot(x,y,'k-',linewidth=1)
     
     sf = shp.Reader(Points)
     
-    px=[]
-    py=[]
-    for shape in sf.shapes():
-        for point in shape.points:
-            px.append(point[0])
-            py.append(point[1])
-        plt.plot(px,py,'r.')
+    px, py = raster.shape_vertices(sf.shapes(), separate=False)
+    plt.plot(px,py,'r.')
     
     #suppress the ticks and labels
     ax.xaxis.set_visible(False)
@@ -142,7 +127,6 @@ def Draw_Outline(Country_Outline,State_Borders,Points):
 def Merge_Hillshades(files):
     
     import matplotlib.pyplot as plt
-    import numpy as np
     import matplotlib.cm as cmx
     from matplotlib import rcParams
     import raster_plotter_simple as raster
@@ -158,23 +142,41 @@ def Merge_Hillshades(files):
     
     labels = ['a','b','c','d']
     
+    #rasters are read at the coarsest overview level with at least this many pixels across each panel
+    panel_pixels = int(mm_to_inch(95) * 500)
+    
+    def read_panel(i):
+        #get the header, then read only the part of the hillshade which is displayed
+        hillshade_header = raster.read_headers(files[i-1][:-4])
+        
+        x_center = int(hillshade_header[0]/2.)    
+        y_center = int(hillshade_header[1]/2.)    
+        
+        #the axis limits below include their max row and column, so read up to one past them
+        window = raster.window_bounds(hillshade_header, rows=(y_center-2000,y_center+2001), cols=(x_center-2000,x_center+2001))
+        hillshade, window_header = raster.read_flt_window(files[i-1], window[:2], window[2:], target_size=panel_pixels, nan=True)
+        
+        return hillshade_header, hillshade, window_header
+    
+    #each panel is read in the background while the one before it is drawn
+    panels = raster.prefetch(read_panel, range(1,5))
+    
     for i in range(1,5):
         
         ax = plt.subplot(2,2,i)
         
-        #get data
-        hillshade, hillshade_header = raster.read_flt(files[i-1])
-       
-        #ignore nodata values    
-        hillshade = np.ma.masked_where(hillshade == -9999, hillshade)    
+        hillshade_header, hillshade, window_header = next(panels)
         
         x_max = hillshade_header[0]
         x_min = 0
         y_max = hillshade_header[1] 
         y_min = 0
         
-        #plot the hillshade on the axes
-        plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray) 
+        x_center = int(x_max/2.)    
+        y_center = int(y_max/2.)    
+        
+        #plot the hillshade on the axes, placed in the pixel coordinates of the full raster
+        plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray, extent=raster.header_extent(hillshade_header, window_header)) 
     
         #place axis ticks around the outside of each plot
         if (i == 1): #top left  
@@ -198,15 +200,12 @@ def Merge_Hillshades(files):
     
         # now get the tick marks    
         n_target_tics = 4
-        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics)  
+        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,(x_center-2000,x_center+2000,y_center+2000,y_center-2000))  
         plt.xticks(xlocs, new_x_labels, rotation=60)
         plt.yticks(ylocs, new_y_labels) 
         
         plt.annotate(labels[i-1], xy=(0.92, 0.96), backgroundcolor='white', xycoords='axes fraction', fontsize=10, horizontalalignment='left', verticalalignment='top')
     
-        x_center = int(x_max/2.)    
-        y_center = int(y_max/2.)    
-        
         plt.xlim(x_center-2000,x_center+2000)    
         plt.ylim(y_center+2000,y_center-2000)        
         
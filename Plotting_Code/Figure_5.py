@@ -39,6 +39,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import string
     
 # Set up fonts for plots
@@ -68,27 +69,15 @@ fig_labels = list(string.ascii_lowercase)[:4] #generate subplot labels
 
 #================ modifyable parameters end here ====================
 
+#load and filter the hilltopdata files of all four sites at once
+site_data = lhd.load_sites([path+filename for filename in Filenames], lhd.filter_hilltop_data, conditions=lhd.HILLTOP_FILTER)
+
 fig = plt.figure()
 
 for subplot_count, (filename,location,xmax,ymax,xstep,ystep,title_move,labels) in enumerate(zip(Filenames,locations,xmaxes,ymaxes,xsteps,ysteps,title_moves,fig_labels)):
 
-    #load the hilltopdata file to get the LH data 
-    with open(path+filename,'r') as f:
-        f.readline()
-        data = f.readlines()
-    
-        LH = []
-            
-        for d in data:
-            if 'fail' not in d:
-                split = d.split(',')
-                relief = float(split[4])
-                lh = float(split[5])
-                hilltop_slope = float(split[8])
-                if (lh > 2.0):
-                    if (relief > 2.0):
-                        if (hilltop_slope < 1.2):
-                            LH.append(lh)
+    #get the filtered LH data for this site
+    LH = site_data[lhd.site_name(filename)]['lh']
     
     #get the median absolute devaition
     MAD = mpy.calculate_MedianAbsoluteDeviation(LH)
@@ -38,6 +38,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
 import string
     
@@ -72,22 +73,16 @@ nbins = 20
 
 #================ modifyable parameters end here ====================
 
+#load the paperdata files of all four sites at once
+site_data = lhd.load_sites([path+filename for filename in Filenames], lhd.load_paper_data)
+
 fig = plt.figure()
 
 for subplot_count, (filename,location,xmax,ymax,xstep,ystep,labels,v_line_lim) in enumerate(zip(Filenames,locations,xmaxes,ymaxes,xsteps,ysteps,fig_labels,v_line_lims)):
 
-    #load the paperdata file to get the LH data
-    with open(path+filename,'r') as f:
-        f.readline()
-        data = f.readlines()
-    
-        LH = []
-            
-        for d in data:       
-            split = d.split()        
-            lh = float(split[2])        
-            if (lh > 2.0):           
-                LH.append(lh)
+    #get the paperdata for this site
+    data = site_data[lhd.site_name(filename)]
+    LH = data['hfr_lh'][data['hfr_lh_valid']]
     
     #get the median absolute devaition
     MAD = mpy.calculate_MedianAbsoluteDeviation(LH)
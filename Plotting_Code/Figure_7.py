@@ -40,6 +40,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
 import string
     
@@ -74,24 +75,17 @@ nbins = 20
 
 #================ modifyable parameters end here ====================
 
+#load the paperdata files of all four sites at once
+site_data = lhd.load_sites([path+filename for filename in Filenames], lhd.load_paper_data)
+
 fig = plt.figure()
 
 for subplot_count, (filename,location,xmax,ymax,xstep,ystep,labels,plot_filter) in enumerate(zip(Filenames,locations,xmaxes,ymaxes,xsteps,ysteps,fig_labels,plot_filters)):
 
-    #load the paperdata file to get the LH data
-    with open(path+filename,'r') as f:
-        f.readline()
-        data = f.readlines()
-
-        SA = []
-        SA_Plot = []
-        for d in data:       
-            split = d.split()        
-            sa_lh = float(split[9])        
-            if (sa_lh > 2.0):           
-                SA.append(sa_lh)
-                if (sa_lh < plot_filter):
-                    SA_Plot.append(sa_lh)
+    #get the paperdata for this site
+    data = site_data[lhd.site_name(filename)]
+    SA = data['sa_lh'][data['sa_lh_valid']]
+    SA_Plot = SA[SA < plot_filter]
     
     #get the median absolute devaition
     MAD = mpy.calculate_MedianAbsoluteDeviation(SA)
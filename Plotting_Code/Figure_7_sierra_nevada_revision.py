@@ -38,6 +38,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
 import string
     
@@ -74,28 +75,12 @@ nbins = 20
 fig = plt.figure()
 
 #load the paperdata file to get the LH data
-with open(path+filename,'r') as f:
-    f.readline()
-    data = f.readlines()
-
-    lh_ = []
-    SA = []
-    SA_Plot =[]
-    DD = []        
-    for d in data:       
-        split = d.split()        
-        lh = float(split[2])
-        sa_lh = float(split[9])        
-        dd = float(split[11])        
-        
-        if (sa_lh > 2.0):           
-            SA.append(sa_lh)
-            if (sa_lh < 2000.):
-                SA_Plot.append(sa_lh)
-        if (lh > 2.0):           
-            lh_.append(lh)
-        if (dd > 2.0):           
-            DD.append(dd)
+data = lhd.load_paper_data(path+filename)
+
+lh_ = data['hfr_lh'][data['hfr_lh_valid']]
+SA = data['sa_lh'][data['sa_lh_valid']]
+SA_Plot = SA[SA < 2000.]
+DD = data['dd_lh'][data['dd_lh_valid']]
 
 Calc_Data = [lh_,SA,DD]
 Plot_Data = [lh_,SA_Plot,DD]
@@ -38,6 +38,7 @@ def mm_to_inch(mm):
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
 import MuddPyStatsTools as mpy
+import lh_data_loader as lhd
 import numpy as np
 import string
     
@@ -71,22 +72,16 @@ nbins = 20
 
 #================ modifyable parameters end here ====================
 
+#load the paperdata files of all four sites at once
+site_data = lhd.load_sites([path+filename for filename in Filenames], lhd.load_paper_data)
+
 fig = plt.figure()
 
 for subplot_count, (filename,location,xmax,ymax,xstep,ystep,labels,v_line_lim) in enumerate(zip(Filenames,locations,xmaxes,ymaxes,xsteps,ysteps,fig_labels,v_line_lims)):
 
-    #load the paperdata file to get the LH data
-    with open(path+filename,'r') as f:
-        f.readline()
-        data = f.readlines()
-    
-        DD = []
-            
-        for d in data:       
-            split = d.split()        
-            dd = float(split[11])        
-            if (dd > 2.0):           
-                DD.append(dd)
+    #get the paperdata for this site
+    data = site_data[lhd.site_name(filename)]
+    DD = data['dd_lh'][data['dd_lh_valid']]
     
     #get the median absolute devaition
     MAD = mpy.calculate_MedianAbsoluteDeviation(DD)
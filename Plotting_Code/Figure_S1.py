@@ -47,8 +47,6 @@ def mm_to_inch(mm):
 def Mask_Hillshades(files,masks):
     
     import matplotlib.pyplot as plt
-    import numpy as np
-    import matplotlib.cm as cmx
     from matplotlib import rcParams
     import raster_plotter_simple as raster
             
@@ -63,26 +61,43 @@ def Mask_Hillshades(files,masks):
     
     labels = ['a','b','c','d']
     
+    #rasters are read at the coarsest overview level with at least this many pixels across each panel
+    panel_pixels = int(mm_to_inch(95) * 250)
+    
+    def read_panel(i):
+        #get the header, then read only the part of the rasters which is displayed
+        hillshade_header = raster.read_headers(files[i-1][:-4])
+        
+        x_center = int(hillshade_header[0]/2.)    
+        y_center = int(hillshade_header[1]/2.)    
+        
+        #the axis limits below include their max row and column, so read up to one past them
+        window = raster.window_bounds(hillshade_header, rows=(y_center-2000,y_center+2001), cols=(x_center-2000,x_center+2001))
+        #blend the hillshade and mask into one image at the resolution of the panel,
+        #the mask layer shows the hillshade inside the mask
+        composite, window_header = raster.read_composite(files[i-1], masks[i-1], window[:2], window[2:], panel_pixels, 'Reds', shade_mask=True)
+        
+        return hillshade_header, composite, window_header
+    
+    #each panel is read in the background while the one before it is drawn
+    panels = raster.prefetch(read_panel, range(1,5))
+    
     for i in range(1,5):
         
         ax = plt.subplot(2,2,i)
         
-        #get data
-        hillshade, hillshade_header = raster.read_flt(files[i-1])
-        mask, mask_header = raster.read_flt(masks[i-1])
-       
-        #ignore nodata values    
-        hillshade = np.ma.masked_where(hillshade == -9999, hillshade)    
-        mask = np.ma.masked_where(mask == -9999, hillshade)    
+        hillshade_header, composite, window_header = next(panels)
         
         x_max = hillshade_header[0]
         x_min = 0
         y_max = hillshade_header[1] 
         y_min = 0
         
-        #plot the hillshade on the axes
-        plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray) 
-        plt.imshow(mask,cmap=cmx.Reds)
+        x_center = int(x_max/2.)    
+        y_center = int(y_max/2.)    
+        
+        #plot the hillshade and mask on the axes, placed in the pixel coordinates of the full raster
+        plt.imshow(composite, extent=raster.header_extent(hillshade_header, window_header)) 
             
         #place axis ticks around the outside of each plot
         if (i == 1): #top left  
@@ -106,15 +121,12 @@ def Mask_Hillshades(files,masks):
     
         # now get the tick marks    
         n_target_tics = 4
-        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics)  
+        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,(x_center-2000,x_center+2000,y_center+2000,y_center-2000))  
         plt.xticks(xlocs, new_x_labels, rotation=60)
         plt.yticks(ylocs, new_y_labels) 
         
         plt.annotate(labels[i-1], xy=(0.92, 0.96), backgroundcolor='white', xycoords='axes fraction', fontsize=10, horizontalalignment='left', verticalalignment='top')
     
-        x_center = int(x_max/2.)    
-        y_center = int(y_max/2.)    
-        
         plt.xlim(x_center-2000,x_center+2000)    
         plt.ylim(y_center+2000,y_center-2000)        
         
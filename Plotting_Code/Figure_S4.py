@@ -47,12 +47,8 @@ def mm_to_inch(mm):
 def Mask_Hillshades(files,masks):
     
     import matplotlib.pyplot as plt
-    import numpy as np
-    import matplotlib.cm as cmx
     from matplotlib import rcParams
     import raster_plotter_simple as raster
-    import matplotlib as mpl
-    import matplotlib.cm as cm    
             
     # Set up fonts for plots
     rcParams['font.family'] = 'sans-serif'
@@ -65,30 +61,51 @@ def Mask_Hillshades(files,masks):
     
     labels = ['a','b','c','d']
     
+    #rasters are read at the coarsest overview level with at least this many pixels across each panel
+    panel_pixels = int(mm_to_inch(95) * 250)
+    
+    #one colour scale for every panel, spanning the 2nd to 98th percentiles of all of the masks
+    limits = [raster.color_limits(mask) for mask in masks]
+    vmin = min(low for low, high in limits)
+    vmax = max(high for low, high in limits)
+    
+    def read_panel(i):
+        #get the header, then read only the part of the rasters which is displayed
+        hillshade_header = raster.read_headers(files[i-1][:-4])
+        
+        x_center = int(hillshade_header[0]/2.)    
+        y_center = int(hillshade_header[1]/2.)    
+        
+        #the axis limits below include their max row and column, so read up to one past them
+        #panel a is a close up
+        if (i == 1):
+            window = raster.window_bounds(hillshade_header, rows=(0,y_center-2889), cols=(x_center-2200,x_center-1099))
+        else:
+            window = raster.window_bounds(hillshade_header, rows=(y_center-1200,y_center+1201), cols=(x_center-1200,x_center+1201))
+        #blend the hillshade and mask into one image at the resolution of the panel
+        composite, window_header = raster.read_composite(files[i-1], masks[i-1], window[:2], window[2:], panel_pixels, 'Reds_r', vmin=vmin, vmax=vmax, alpha=0.7)
+        
+        return hillshade_header, composite, window_header
+    
+    #each panel is read in the background while the one before it is drawn
+    panels = raster.prefetch(read_panel, range(1,5))
+    
     for i in range(1,5):
         
         ax = plt.subplot(2,2,i)
         
-        #get data
-        hillshade, hillshade_header = raster.read_flt(files[i-1])
-        mask, mask_header = raster.read_flt(masks[i-1])
-       
-        #ignore nodata values    
-        hillshade = np.ma.masked_where(hillshade == -9999, hillshade)    
-        mask = np.ma.masked_where(mask == -9999, mask)    
+        hillshade_header, composite, window_header = next(panels)
         
         x_max = hillshade_header[0]
         x_min = 0
         y_max = hillshade_header[1] 
         y_min = 0
         
+        x_center = int(x_max/2.)    
+        y_center = int(y_max/2.)    
         
-        norm = mpl.colors.Normalize(vmin=0.015, vmax=0.025)
-               
-        
-        #plot the hillshade on the axes
-        plt.imshow(hillshade, vmin=0, vmax=255, cmap=cmx.gray) 
-        plt.imshow(mask,cmap=cmx.Reds_r,norm=norm,alpha=0.7)
+        #plot the hillshade and mask on the axes, placed in the pixel coordinates of the full raster
+        plt.imshow(composite, extent=raster.header_extent(hillshade_header, window_header)) 
         
         #plt.colorbar()
             
@@ -114,30 +131,24 @@ def Mask_Hillshades(files,masks):
     
         # now get the tick marks    
         n_target_tics = 8
-        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics)  
+        xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,(x_center-1200,x_center+1200,y_center+1200,y_center-1200))  
         plt.xticks(xlocs, new_x_labels, rotation=60)
         plt.yticks(ylocs, new_y_labels) 
         
         plt.annotate(labels[i-1], xy=(0.92, 0.96), backgroundcolor='white', xycoords='axes fraction', fontsize=10, horizontalalignment='left', verticalalignment='top')
     
-        x_center = int(x_max/2.)    
-        y_center = int(y_max/2.)    
-        
         plt.xlim(x_center-1200,x_center+1200)    
         plt.ylim(y_center+1200,y_center-1200)        
 
         if (i == 1):
             
             n_target_tics = 16
-            xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics)  
+            xlocs,ylocs,new_x_labels,new_y_labels = raster.format_ticks_for_UTM_imshow(hillshade_header,x_max,x_min,y_max,y_min,n_target_tics,(x_center-2200,x_center-1100,y_center-2890,0))  
             plt.xticks(xlocs, new_x_labels, rotation=60)
             plt.yticks(ylocs, new_y_labels) 
             
             plt.annotate(labels[i-1], xy=(0.92, 0.96), backgroundcolor='white', xycoords='axes fraction', fontsize=10, horizontalalignment='left', verticalalignment='top')
         
-            x_center = int(x_max/2.)    
-            y_center = int(y_max/2.)                
-                
             plt.ylim(y_center-2890,0)
             plt.xlim(x_center-2200,x_center-1100)
         